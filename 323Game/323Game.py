@@ -2,6 +2,21 @@ import math
 import random
 import pygame
 import os
+import csv
+import json
+import time
+import struct
+import sys
+import hashlib
+import argparse
+import heapq
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+import numpy as np
 
 # Initialize pygame
 pygame.init()
@@ -10,9 +25,21 @@ pygame.init()
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 FPS = 60
+SIM_RATE = 60  # Simulation ticks per second, independent of how fast frames are drawn
+MAX_SIM_STEPS = 5  # Most ticks run in one frame to catch up; time beyond that is dropped
 PLAYER_SPEED = 300
 WORLD_WIDTH = 3000
 WORLD_HEIGHT = 3000
+LEVEL_FILE = os.path.join("Levels", "main.json")
+MAP_FILE = None  # e.g. os.path.join("Maps", "TLSBNR_MainMap.tmx"): tile map loader/renderer demo, not a playable level
+DEFAULT_MUSIC = "2.Aria of the Soul(P4).mp3"
+CHASE_MUSIC = "Hollow Knight OST.mp3"
+FONT_SIZES = [20, 24, 30, 36, 48, 64]
+DIRTY_RECTS = False  # Redraw and present only the changed parts of the screen while the camera is still
+PROFILE = False  # Start with the frame profiler recording (F3 toggles it and its overlay, F4 exports)
+MOB_LOD = True  # Throttle mobs away from the player and freeze distant ones (see MobSwarm.schedule)
+MOB_WORKERS = 0  # Worker processes for mob AI (0 runs it in the game process); for very large swarms on Linux
+RENDER_SCALE = 1  # Draw the world at 1/RENDER_SCALE of the window's resolution and scale it up; must divide the screen size
 
 # Colors
 BLACK = (0, 0, 0)
@@ -28,6 +55,190 @@ screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 pygame.display.set_caption("Lone Voyager")
 clock = pygame.time.Clock()
 
+# Keys the game polls every frame; recordings store them as a bitmask
+TRACKED_KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d,
+                pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_p)
+RECORDING_MAGIC = b"LVREC"
+RECORDING_VERSION = 2
+RECORDING_END = b"LVEND"
+# The only event types the game reacts to; mouse motion and the like are left out of recordings
+RECORDED_EVENTS = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.WINDOWEXPOSED)
+LEVEL_MAGIC = b"LVLC"
+LEVEL_VERSION = 1
+
+# Everything random in the simulation draws from here so a seed reproduces a session
+rng = random.Random()
+
+class LiveInput:
+    def events(self):
+        return pygame.event.get()
+    
+    def wait(self):
+        # Sleeps until there is at least one event
+        return [pygame.event.wait()] + pygame.event.get()
+    
+    def pressed(self):
+        return pygame.key.get_pressed()
+    
+    def tick(self, fps):
+        return clock.tick(fps)
+
+class HeldKeys:
+    def __init__(self, held):
+        self.held = held
+    
+    def __getitem__(self, key):
+        return key in self.held
+
+class InputRecorder(LiveInput):
+    def __init__(self, path, seed):
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC + struct.pack("<BQB", RECORDING_VERSION, seed, len(TRACKED_KEYS)))
+        self.file.write(struct.pack(f"<{len(TRACKED_KEYS)}i", *TRACKED_KEYS))
+        self.frames = 0
+    
+    def events(self):
+        return self.record_events(pygame.event.get())
+    
+    def wait(self):
+        return self.record_events([pygame.event.wait()] + pygame.event.get())
+    
+    def record_events(self, events):
+        recorded = [event for event in events if event.type in RECORDED_EVENTS]
+        record = [b"E", struct.pack("<H", len(recorded))]
+        for event in recorded:
+            text = getattr(event, "unicode", "").encode("utf-8")
+            if len(text) > 255:
+                # Cut on a character boundary so the replay can still decode it
+                text = text[:255].decode("utf-8", "ignore").encode("utf-8")
+            record.append(struct.pack("<IiHB", event.type, getattr(event, "key", 0), getattr(event, "mod", 0), len(text)))
+            record.append(text)
+        self.file.write(b"".join(record))
+        return events
+    
+    def pressed(self):
+        keys = pygame.key.get_pressed()
+        mask = 0
+        for bit, key in enumerate(TRACKED_KEYS):
+            if keys[key]:
+                mask |= 1 << bit
+        self.file.write(b"K" + struct.pack("<I", mask))
+        return keys
+    
+    def tick(self, fps):
+        ms = clock.tick(fps)
+        self.file.write(b"T" + struct.pack("<I", ms))
+        self.frames += 1
+        if self.frames % FPS == 0:
+            self.file.flush()
+        return ms
+    
+    def close(self, digest=None):
+        # The trailer holds a digest of the final world state, so a replay can check it ended up identical
+        self.file.write(b"D" + (digest or bytes(20)) + RECORDING_END)
+        self.file.close()
+
+class ReplayFinished(Exception):
+    pass
+
+class InputReplay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(RECORDING_MAGIC):
+            raise ValueError(f"{path} is not a Lone Voyager recording")
+        
+        offset = len(RECORDING_MAGIC)
+        version, self.seed, key_count = struct.unpack_from("<BQB", data, offset)
+        if version != RECORDING_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {version}")
+        offset += struct.calcsize("<BQB")
+        self.keys = struct.unpack_from(f"<{key_count}i", data, offset)
+        offset += 4 * key_count
+        
+        # A session that was killed has no trailer; it replays up to where the file stops
+        self.digest = None
+        if data.endswith(RECORDING_END):
+            self.digest = data[-len(RECORDING_END) - 20:-len(RECORDING_END)]
+            data = data[:-len(RECORDING_END) - 21]
+            if self.digest == bytes(20):
+                self.digest = None
+        
+        self.data = data
+        self.offset = offset
+        self.frames = 0
+    
+    def read(self, fmt):
+        # A killed session can stop partway through a record; that counts as the end of the replay
+        size = struct.calcsize(fmt)
+        if self.offset + size > len(self.data):
+            raise ReplayFinished(self.frames)
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += size
+        return values
+    
+    def next_record(self, tag):
+        (found,) = self.read("<c")
+        if found != tag:
+            raise ValueError(f"replay diverged at frame {self.frames}: expected {tag!r}, found {found!r}")
+    
+    def events(self):
+        self.next_record(b"E")
+        (count,) = self.read("<H")
+        events = []
+        for _ in range(count):
+            event_type, key, mod, length = self.read("<IiHB")
+            (text,) = self.read(f"<{length}s")
+            if event_type in (pygame.KEYDOWN, pygame.KEYUP):
+                events.append(pygame.event.Event(event_type, key=key, mod=mod, unicode=text.decode("utf-8")))
+            else:
+                events.append(pygame.event.Event(event_type))
+        pygame.event.pump()
+        return events
+    
+    def wait(self):
+        # Replays never sleep; whatever woke the recorded session is the next batch of events
+        return self.events()
+    
+    def pressed(self):
+        self.next_record(b"K")
+        (mask,) = self.read("<I")
+        return HeldKeys({key for bit, key in enumerate(self.keys) if mask & (1 << bit)})
+    
+    def tick(self, fps):
+        # Replays run flat out: the recorded frame time is returned without waiting for it
+        self.next_record(b"T")
+        (ms,) = self.read("<I")
+        self.frames += 1
+        return ms
+
+game_input = LiveInput()
+
+class FixedTimestep:
+    def __init__(self, rate=SIM_RATE, max_steps=MAX_SIM_STEPS):
+        self.step = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.dropped = 0.0
+    
+    def advance(self, dt):
+        # How many fixed ticks this frame's dt pays for; alpha is how far we are into the next one
+        self.accumulator += dt
+        steps = int(self.accumulator / self.step)
+        if steps > self.max_steps:
+            # A stall (slow frame, window drag) would otherwise snowball into ever longer catch-up frames
+            self.dropped += (steps - self.max_steps) * self.step
+            self.accumulator -= (steps - self.max_steps) * self.step
+            steps = self.max_steps
+        self.accumulator -= steps * self.step
+        self.alpha = self.accumulator / self.step
+        return steps
+    
+    def reset(self):
+        self.accumulator = 0.0
+        self.alpha = 1.0
+
 class Camera:
     def __init__(self, width, height):
         self.camera = pygame.Rect(0, 0, width, height)
@@ -40,9 +251,18 @@ class Camera:
     def apply_rect(self, rect):
         return rect.move(self.camera.topleft)
     
-    def update(self, target):
-        x = -target.rect.centerx + int(SCREEN_WIDTH / 2)
-        y = -target.rect.centery + int(SCREEN_HEIGHT / 2)
+    @property
+    def visible_rect(self):
+        # The part of the world currently on screen, in world coordinates
+        return pygame.Rect(-self.camera.x, -self.camera.y, SCREEN_WIDTH, SCREEN_HEIGHT)
+    
+    def to_world(self, screen_rect):
+        return screen_rect.move(-self.camera.x, -self.camera.y)
+    
+    def update(self, target, alpha=1.0):
+        rect = target.render_rect(alpha)
+        x = -rect.centerx + int(SCREEN_WIDTH / 2)
+        y = -rect.centery + int(SCREEN_HEIGHT / 2)
         
         x = min(0, x)
         y = min(0, y)
@@ -51,135 +271,624 @@ class Camera:
         
         self.camera = pygame.Rect(x, y, self.width, self.height)
 
+class TextCache:
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_layouts=256):
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.layouts = OrderedDict()
+        self.max_bytes = max_bytes
+        self.max_layouts = max_layouts
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def font(self, size, face=None):
+        key = (face, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.font.Font(face, size)
+            self.fonts[key] = font
+        return font
+    
+    def render(self, text, size, color, face=None):
+        key = (text, size, tuple(color), face)
+        text_surface = self.surfaces.get(key)
+        if text_surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return text_surface
+        
+        self.misses += 1
+        text_surface = self.font(size, face).render(text, True, color)
+        self.surfaces[key] = text_surface
+        self.resident_bytes += text_surface.get_pitch() * text_surface.get_height()
+        
+        # Evict least recently used surfaces once over the memory cap
+        while self.resident_bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, old_surface = self.surfaces.popitem(last=False)
+            self.resident_bytes -= old_surface.get_pitch() * old_surface.get_height()
+        return text_surface
+    
+    def wrap(self, text, size, max_width, face=None):
+        key = (text, size, max_width, face)
+        lines = self.layouts.get(key)
+        if lines is not None:
+            self.layouts.move_to_end(key)
+            return lines
+        
+        font = self.font(size, face)
+        words = text.split(' ')
+        lines = []
+        current_line = []
+        
+        for word in words:
+            test_line = ' '.join(current_line + [word])
+            if font.size(test_line)[0] < max_width:
+                current_line.append(word)
+            else:
+                lines.append(' '.join(current_line))
+                current_line = [word]
+        if current_line:
+            lines.append(' '.join(current_line))
+        
+        lines = tuple(lines)
+        self.layouts[key] = lines
+        if len(self.layouts) > self.max_layouts:
+            self.layouts.popitem(last=False)
+        return lines
+    
+    def clear(self):
+        self.surfaces.clear()
+        self.layouts.clear()
+        self.resident_bytes = 0
+
+text_cache = TextCache()
+
 def draw_text(surface, text, size, color, x, y, center=True):
-    font = pygame.font.Font(None, size)
-    text_surface = font.render(text, True, color)
+    text_surface = text_cache.render(text, size, color)
     if center:
         text_rect = text_surface.get_rect(center=(x, y))
     else:
         text_rect = text_surface.get_rect(topleft=(x, y))
     surface.blit(text_surface, text_rect)
 
-def show_start_screen():
-    screen.fill(BLACK)
-    draw_text(screen, "LONE VOYAGER", 64, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
-    draw_text(screen, "WASD or Arrow Keys to Move", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-    draw_text(screen, "P: Stun | O: Interact | I: Cipher Wheel", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50)
-    draw_text(screen, "Press any key to begin", 36, RED, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3/4)
-    pygame.display.flip()
-    
-    waiting = True
-    while waiting:
-        clock.tick(FPS)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return False
-            if event.type == pygame.KEYUP:
-                waiting = False
-    return True
-
-def show_game_over_screen():
-    screen.fill(BLACK)
-    draw_text(screen, "GAME OVER", 64, RED, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
-    draw_text(screen, "Press any key to play again", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-    pygame.display.flip()
-    
-    waiting = True
-    while waiting:
-        clock.tick(FPS)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return False
-            if event.type == pygame.KEYUP:
-                waiting = False
-    return True
-
-def show_message_screen(message):
-    overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 180))
-    screen.blit(overlay, (0, 0))
-    
-    message_rect = pygame.Rect(SCREEN_WIDTH // 4, SCREEN_HEIGHT // 3, 
-                             SCREEN_WIDTH // 2, SCREEN_HEIGHT // 3)
-    pygame.draw.rect(screen, WHITE, message_rect)
-    pygame.draw.rect(screen, BLACK, message_rect, 2)
-    
-    font = pygame.font.Font(None, 36)
-    words = message.split(' ')
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        if font.size(test_line)[0] < message_rect.width - 40:
-            current_line.append(word)
+class OverlayCache:
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, levels=20):
+        self.width = width
+        self.height = height
+        self.levels = levels
+        self.surfaces = {}
+    
+    def quantize(self, intensity):
+        return round(max(0.0, min(1.0, intensity)) * self.levels)
+    
+    def dim(self, alpha=180):
+        key = ("dim", alpha)
+        overlay = self.surfaces.get(key)
+        if overlay is None:
+            # A plain surface with per-surface alpha blends the same as an SRCALPHA fill, but faster
+            overlay = pygame.Surface((self.width, self.height))
+            overlay.fill(BLACK)
+            overlay.set_alpha(alpha)
+            self.surfaces[key] = overlay
+        return overlay
+    
+    def suspicion_border(self, intensity):
+        level = self.quantize(intensity)
+        key = ("suspicion_border", level)
+        strips = self.surfaces.get(key)
+        if strips is None:
+            intensity = level / self.levels
+            border_size = int(10 * intensity)
+            strips = []
+            if border_size > 0:
+                # Four edge strips instead of a full-screen surface that is almost entirely transparent
+                color = (255, 0, 0, int(150 * intensity))
+                for x, y, w, h in [(0, 0, self.width, border_size),
+                                   (0, self.height - border_size, self.width, border_size),
+                                   (0, border_size, border_size, self.height - 2 * border_size),
+                                   (self.width - border_size, border_size, border_size, self.height - 2 * border_size)]:
+                    strip = pygame.Surface((w, h), pygame.SRCALPHA)
+                    strip.fill(color)
+                    strips.append((strip, (x, y)))
+            self.surfaces[key] = strips
+        return strips
+
+overlays = OverlayCache()
+
+class HudWidget:
+    # One fixed region of the HUD. It is redrawn only when the value bound to it changes, so values
+    # should be quantized to what is visible (whole pixels of a bar, not the float behind it).
+    # Subclasses define draw(surface, value), where surface is their region of the layer in local coordinates
+    def __init__(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.bounds = pygame.Rect(self.rect.topleft, (0, 0))
+        self.value = None
+        self.valid = False
+    
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.valid = False
+
+class StunWidget(HudWidget):
+    # Stops where the suspicion meter starts: clearing a region that overlapped it would erase the meter
+    def __init__(self):
+        super().__init__((0, 0, SCREEN_WIDTH - 230, 50))
+    
+    def draw(self, surface, value):
+        # value is the cooldown bar's width, "prompt" when the stun is ready, or None to show nothing
+        if value == "prompt":
+            draw_text(surface, "Press P to stun nearby enemies", 24, WHITE, SCREEN_WIDTH // 2, 30)
+        elif value is not None:
+            pygame.draw.rect(surface, RED, (10, 10, value, 20))
+            pygame.draw.rect(surface, WHITE, (10, 10, 200, 20), 2)
+            draw_text(surface, "Stun Cooldown", 20, WHITE, 110, 20)
+
+class SuspicionMeterWidget(HudWidget):
+    def __init__(self):
+        super().__init__((SCREEN_WIDTH - 230, 10, 230, 60))
+    
+    def draw(self, surface, value):
+        pygame.draw.rect(surface, (50, 50, 50), (10, 10, 200, 20))
+        pygame.draw.rect(surface, RED, (10, 10, value, 20))
+        pygame.draw.rect(surface, WHITE, (10, 10, 200, 20), 2)
+        surface.blit(text_cache.render("SUSPICION", 24, WHITE), (10, 35))
+
+class CipherHintWidget(HudWidget):
+    def __init__(self):
+        super().__init__((0, SCREEN_HEIGHT - 50, SCREEN_WIDTH, 50))
+    
+    def draw(self, surface, wheel_visible):
+        if wheel_visible:
+            draw_text(surface, "Press I to close cipher wheel", 24, WHITE, SCREEN_WIDTH // 2, 20)
         else:
-            lines.append(' '.join(current_line))
-            current_line = [word]
-    if current_line:
-        lines.append(' '.join(current_line))
+            draw_text(surface, "Press I to open cipher wheel", 24, WHITE, SCREEN_WIDTH // 2, 20)
+
+class HudLayer:
+    # Every widget draws into its own region of one screen-sized layer, which is composited with a
+    # single blits call; a frame where nothing changed redraws no widget at all
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.widgets = {
+            "stun": StunWidget(),
+            "meter": SuspicionMeterWidget(),
+            "hint": CipherHintWidget(),
+        }
+        self.redraws = 0
     
-    y_offset = message_rect.y + 20
-    for line in lines:
-        draw_text(screen, line, 36, BLACK, SCREEN_WIDTH // 2, y_offset)
-        y_offset += 40
+    def update(self, values):
+        for name, value in values.items():
+            widget = self.widgets[name]
+            widget.set(value)
+            if not widget.valid:
+                # Clear to transparent white: all HUD text is white, so its antialiased edges blend against
+                # their own colour instead of darkening towards black
+                self.surface.fill((255, 255, 255, 0), widget.rect)
+                region = self.surface.subsurface(widget.rect)
+                widget.draw(region, value)
+                # Only the part actually drawn on is composited, not the whole (mostly empty) region
+                widget.bounds = region.get_bounding_rect().move(widget.rect.topleft)
+                widget.valid = True
+                self.redraws += 1
+        profiler.count("hud_redraws", self.redraws)
     
-    draw_text(screen, "Press ENTER to continue", 36, BLACK, SCREEN_WIDTH // 2, message_rect.bottom - 40)
+    def state(self):
+        # name -> (value, screen rect), for the dirty rect renderer
+        return {name: (widget.value, widget.rect) for name, widget in self.widgets.items()}
     
-    pygame.display.flip()
+    def draw(self, surface, names=None):
+        widgets = self.widgets.values() if names is None else [self.widgets[name] for name in names]
+        surface.blits([(self.surface, widget.bounds, widget.bounds) for widget in widgets], False)
+
+class ProfileSection:
+    __slots__ = ("profiler", "name", "start")
     
-    waiting = True
-    while waiting:
-        clock.tick(FPS)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return False
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
-                waiting = False
-    return True
-
-def show_code_input_screen():
-    code = ""
-    input_active = True
-    
-    while input_active:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return False, False
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exc):
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+class NullSection:
+    def __enter__(self):
+        pass
+    
+    def __exit__(self, *exc):
+        return False
+
+NULL_SECTION = NullSection()
+
+class FrameProfiler:
+    def __init__(self, enabled=False, history=120, max_samples=36000):
+        self.enabled = enabled
+        self.pinned = False  # Keep recording even if F3 is pressed, e.g. while replaying a session
+        self.overlay_visible = False
+        self.history = history
+        self.graph_height = 60
+        self.sections = {}
+        self.current = {}
+        self.counters = {}
+        self.frame_start = None
+        self.frame_times = deque(maxlen=history)
+        self.recent = {}
+        self.samples = deque(maxlen=max_samples)
+        self.frame_index = 0
+    
+    def section(self, name):
+        # Disabled profiling hands out one shared no-op, so instrumented code costs a method call
+        if not self.enabled:
+            return NULL_SECTION
+        section = self.sections.get(name)
+        if section is None:
+            section = ProfileSection(self, name)
+            self.sections[name] = section
+        return section
+    
+    def count(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+    
+    def toggle(self):
+        if self.pinned:
+            self.overlay_visible = not self.overlay_visible
+            return
+        self.enabled = not self.enabled
+        self.overlay_visible = self.enabled
+        self.frame_start = None
+    
+    def begin_frame(self):
+        if self.enabled:
+            self.current = {}
+            self.counters = {}
+            self.frame_start = time.perf_counter()
+    
+    def end_frame(self):
+        if not self.enabled or self.frame_start is None:
+            return
+        
+        total = time.perf_counter() - self.frame_start
+        self.frame_times.append(total)
+        for name, seconds in self.current.items():
+            recent = self.recent.get(name)
+            if recent is None:
+                recent = self.recent[name] = deque(maxlen=self.history)
+            recent.append(seconds)
+        
+        sample = {"frame": self.frame_index, "total_ms": total * 1000}
+        for name, seconds in self.current.items():
+            sample[name + "_ms"] = seconds * 1000
+        sample.update(self.counters)
+        self.samples.append(sample)
+        self.frame_index += 1
+    
+    def averages(self):
+        return {name: sum(recent) / len(recent) * 1000 for name, recent in self.recent.items() if recent}
+    
+    def export(self, path):
+        samples = list(self.samples)
+        if path.endswith(".csv"):
+            fields = []
+            for sample in samples:
+                for key in sample:
+                    if key not in fields:
+                        fields.append(key)
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(samples)
+        else:
+            with open(path, "w") as f:
+                json.dump({"averages_ms": self.averages(), "samples": samples}, f, indent=1)
+    
+    def panel_rect(self, x=10, y=60, averages=None):
+        # One row per section above the frame-time graph; the dirty rect renderer repaints the same area
+        if averages is None:
+            averages = self.averages()
+        return pygame.Rect(x, y, 300, 24 + 18 * len(averages) + self.graph_height)
+    
+    def draw(self, surface, x=10, y=60):
+        if not self.overlay_visible:
+            return
+        
+        averages = self.averages()
+        graph_height = self.graph_height
+        panel = self.panel_rect(x, y, averages)
+        surface.blit(overlays.dim(200), panel, pygame.Rect(0, 0, panel.width, panel.height))
+        
+        frame_ms = sum(self.frame_times) / len(self.frame_times) * 1000 if self.frame_times else 0.0
+        draw_text(surface, "frame", 20, YELLOW, x + 8, y + 6, center=False)
+        draw_text(surface, f"{frame_ms:.2f} ms", 20, YELLOW, x + 160, y + 6, center=False)
+        for i, (name, ms) in enumerate(averages.items()):
+            draw_text(surface, name, 20, WHITE, x + 8, y + 24 + 18 * i, center=False)
+            draw_text(surface, f"{ms:.2f} ms", 20, WHITE, x + 160, y + 24 + 18 * i, center=False)
+        
+        # Frame-time graph, full height is two frames at the target rate
+        graph_top = panel.bottom - graph_height
+        budget = 2.0 / FPS
+        bar_width = panel.width / self.history
+        for i, seconds in enumerate(self.frame_times):
+            height = min(graph_height, graph_height * seconds / budget)
+            color = GREEN if seconds <= 1.0 / FPS else RED
+            pygame.draw.rect(surface, color, (x + i * bar_width, panel.bottom - height, max(1, bar_width), height))
+        pygame.draw.line(surface, YELLOW, (x, graph_top + graph_height // 2), (panel.right, graph_top + graph_height // 2))
+
+profiler = FrameProfiler(PROFILE)
+
+class Scene:
+    static = False  # Nothing animates, so the loop sleeps on the event queue until there is something to react to
+    overlay = False  # Drawn over the scene beneath it rather than replacing it
+    
+    def __init__(self):
+        self.stack = None
+        self.dirty = True
+    
+    def enter(self):
+        pass
+    
+    def exit(self):
+        pass
+    
+    def resume(self):
+        # The scene above this one was popped
+        self.invalidate()
+    
+    def invalidate(self):
+        self.dirty = True
+    
+    def handle_event(self, event):
+        pass
+    
+    def update(self, dt):
+        pass
+    
+    def draw(self, surface):
+        pass
+    
+    def render(self, surface):
+        # Scenes are drawn once and then only when something on them changed
+        if self.dirty:
+            self.stack.draw(surface, self)
+            pygame.display.flip()
+            self.dirty = False
+
+class SceneStack:
+    def __init__(self, surface):
+        self.surface = surface
+        self.scenes = []
+        self.pending = []
+        self.quit_requested = False
+    
+    @property
+    def top(self):
+        return self.scenes[-1] if self.scenes else None
+    
+    # Changes are queued and applied between frames, so a scene never loses the stack mid-frame
+    def push(self, scene):
+        self.pending.append(("push", scene))
+    
+    def pop(self):
+        self.pending.append(("pop", None))
+    
+    def replace(self, scene):
+        self.pop()
+        self.push(scene)
+    
+    def clear(self):
+        self.pending.append(("clear", None))
+    
+    def quit(self):
+        self.quit_requested = True
+        self.clear()
+    
+    def apply(self):
+        pending, self.pending = self.pending, []
+        covered = list(self.scenes)
+        for op, scene in pending:
+            if op == "push":
+                scene.stack = self
+                self.scenes.append(scene)
+                scene.enter()
+            elif op == "pop":
+                if self.scenes:
+                    self.scenes.pop().exit()
+            else:
+                while self.scenes:
+                    self.scenes.pop().exit()
+        if self.top in covered and self.top is not covered[-1]:
+            self.top.resume()
+    
+    def draw(self, surface, scene):
+        # Overlays are drawn over whatever they sit on, down to the first full scene
+        index = self.scenes.index(scene)
+        start = index
+        while start > 0 and self.scenes[start].overlay:
+            start -= 1
+        for below in self.scenes[start:index + 1]:
+            below.draw(surface)
+    
+    def run(self):
+        # One loop, one clock and one input source for every scene; only the top one runs
+        self.apply()
+        dt = 0
+        while self.scenes:
+            scene = self.top
+            waited = scene.static and not scene.dirty
+            events = game_input.wait() if waited else None
+            
+            profiler.begin_frame()
+            with profiler.section("events"):
+                if events is None:
+                    events = game_input.events()
+                for event in events:
+                    if event.type == pygame.QUIT:
+                        self.quit()
+                    elif event.type == pygame.WINDOWEXPOSED:
+                        scene.invalidate()
+                    else:
+                        scene.handle_event(event)
+            
+            with profiler.section("update"):
+                scene.update(dt)
+            if not self.pending:
+                with profiler.section("render"):
+                    scene.render(self.surface)
+            
+            with profiler.section("tick_wait"):
+                dt = game_input.tick(FPS) / 1000
+            profiler.end_frame()
             
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    input_active = False
-                elif event.key == pygame.K_ESCAPE:
-                    return False, False
-                elif event.key == pygame.K_BACKSPACE:
-                    code = code[:-1]
-                elif event.unicode.isdigit() and len(code) < 4:
-                    code += event.unicode
-        
-        # Draw the screen
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        screen.blit(overlay, (0, 0))
-        
-        input_rect = pygame.Rect(SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT // 2 - 50, 300, 100)
-        pygame.draw.rect(screen, WHITE, input_rect)
-        pygame.draw.rect(screen, BLACK, input_rect, 2)
+            # Time spent asleep or switching scenes is nobody's frame time
+            if waited or self.pending:
+                dt = 0
+            if self.pending:
+                self.apply()
+
+class TitleScene(Scene):
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        # Assets decode in the background while the title is up
+        self.preloader = AssetPreloader(assets)
+        preload_game_assets(self.preloader)
+        self.shown_progress = None
+    
+    @property
+    def static(self):
+        return self.preloader.finished
+    
+    def exit(self):
+        self.preloader.shutdown()
+    
+    def handle_event(self, event):
+        if event.type == pygame.KEYUP and self.preloader.finished:
+            self.preloader.shutdown()
+            warm_sprite_sheets()
+            self.stack.replace(PlayScene(self.session))
+    
+    def update(self, dt):
+        self.preloader.poll()
+        if self.preloader.progress != self.shown_progress:
+            self.shown_progress = self.preloader.progress
+            self.dirty = True
+    
+    def draw(self, surface):
+        surface.fill(BLACK)
+        draw_text(surface, "LONE VOYAGER", 64, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
+        draw_text(surface, "WASD or Arrow Keys to Move", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        draw_text(surface, "P: Stun | O: Interact | I: Cipher Wheel", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50)
+        if self.preloader.finished:
+            draw_text(surface, "Press any key to begin", 36, RED, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3/4)
+        else:
+            bar_rect = pygame.Rect(SCREEN_WIDTH // 2 - 200, SCREEN_HEIGHT * 3 // 4 - 10, 400, 20)
+            pygame.draw.rect(surface, RED, (bar_rect.x, bar_rect.y, bar_rect.width * self.preloader.progress, bar_rect.height))
+            pygame.draw.rect(surface, WHITE, bar_rect, 2)
+            draw_text(surface, "Loading...", 24, WHITE, SCREEN_WIDTH // 2, bar_rect.bottom + 20)
+
+class GameOverScene(Scene):
+    static = True
+    
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+    
+    def handle_event(self, event):
+        if event.type == pygame.KEYUP:
+            self.stack.replace(PlayScene(self.session))
+    
+    def draw(self, surface):
+        surface.fill(BLACK)
+        draw_text(surface, "GAME OVER", 64, RED, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
+        draw_text(surface, "Press any key to play again", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+
+class MessageScene(Scene):
+    static = True
+    overlay = True
+    
+    def __init__(self, message):
+        super().__init__()
+        self.message = message
+    
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+            self.stack.pop()
+    
+    def draw(self, surface):
+        surface.blit(overlays.dim(180), (0, 0))
         
-        # Display asterisks instead of numbers
-        display_code = "*" * len(code)
-        draw_text(screen, "Enter 4-digit code:", 36, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 80)
-        draw_text(screen, display_code, 48, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-        draw_text(screen, "Press ENTER to submit", 24, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 60)
+        message_rect = pygame.Rect(SCREEN_WIDTH // 4, SCREEN_HEIGHT // 3, 
+                                 SCREEN_WIDTH // 2, SCREEN_HEIGHT // 3)
+        pygame.draw.rect(surface, WHITE, message_rect)
+        pygame.draw.rect(surface, BLACK, message_rect, 2)
+        
+        lines = text_cache.wrap(self.message, 36, message_rect.width - 40)
         
-        pygame.display.flip()
-        clock.tick(FPS)
+        y_offset = message_rect.y + 20
+        for line in lines:
+            draw_text(surface, line, 36, BLACK, SCREEN_WIDTH // 2, y_offset)
+            y_offset += 40
+        
+        draw_text(surface, "Press ENTER to continue", 36, BLACK, SCREEN_WIDTH // 2, message_rect.bottom - 40)
+
+class CodeInputScene(Scene):
+    static = True
+    overlay = True
     
-    return True, code == "8514"
+    def __init__(self, session, answer):
+        super().__init__()
+        self.session = session
+        self.answer = answer
+        self.code = ""
+        self.shown_code = ""
+        self.input_rect = pygame.Rect(SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT // 2 - 50, 300, 100)
+    
+    def handle_event(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_RETURN:
+            if self.code == self.answer:
+                # Player won!
+                self.session.summary["outcome"] = "won"
+                self.stack.clear()
+                self.stack.push(WinScene())
+            else:
+                self.stack.pop()
+        elif event.key == pygame.K_ESCAPE:
+            self.stack.quit()
+        elif event.key == pygame.K_BACKSPACE:
+            self.code = self.code[:-1]
+        elif event.unicode.isdigit() and len(self.code) < len(self.answer):
+            self.code += event.unicode
+    
+    def draw_input(self, surface):
+        pygame.draw.rect(surface, WHITE, self.input_rect)
+        pygame.draw.rect(surface, BLACK, self.input_rect, 2)
+        
+        # Display asterisks instead of numbers
+        display_code = "*" * len(self.code)
+        draw_text(surface, display_code, 48, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        self.shown_code = self.code
+    
+    def draw(self, surface):
+        surface.blit(overlays.dim(180), (0, 0))
+        draw_text(surface, f"Enter {len(self.answer)}-digit code:", 36, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 80)
+        draw_text(surface, "Press ENTER to submit", 24, BLACK, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 60)
+        self.draw_input(surface)
+    
+    def render(self, surface):
+        # Typing only changes the input box, so only the box is redrawn and presented
+        if self.dirty:
+            super().render(surface)
+        elif self.code != self.shown_code:
+            self.draw_input(surface)
+            pygame.display.update(self.input_rect)
 
 class WheelCipher:
     def __init__(self):
@@ -191,46 +900,75 @@ class WheelCipher:
         self.rotation_speed = 2
         self.outer_letters = "ABCDEFGHIJKLMNO"
         self.inner_numbers = [str(i) for i in range(1, 16)]
+        self.rect = pygame.Rect(self.center_x - self.radius - 20, self.center_y - self.radius - 20,
+                                self.radius * 2 + 40, self.radius * 2 + 80)
+        self.static_layer = None
+        self.highlight_number_pos = None
+        self.outer_layouts = {}
+    
+    def build_static_layer(self):
+        # Circles, the inner numbers and the help text never move, so they are drawn once
+        layer = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        cx = self.center_x - self.rect.x
+        cy = self.center_y - self.rect.y
         
-    def draw(self, surface, suspicion_level):
-        if not self.visible:
-            return
-            
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        surface.blit(overlay, (0, 0))
-        
-        pygame.draw.circle(surface, WHITE, (self.center_x, self.center_y), self.radius, 2)
-        pygame.draw.circle(surface, WHITE, (self.center_x, self.center_y), self.radius // 1.5, 2)
-        
-        for i, letter in enumerate(self.outer_letters):
-            angle = math.radians(self.outer_angle + i * (360 / len(self.outer_letters)))
-            x = self.center_x + (self.radius - 20) * math.cos(angle)
-            y = self.center_y + (self.radius - 20) * math.sin(angle)
-            draw_text(surface, letter, 30, WHITE, x, y)
-            
-            if suspicion_level > 80 and letter == "K":
-                pygame.draw.line(surface, RED, 
-                               (self.center_x, self.center_y),
-                               (x, y), 2)
+        pygame.draw.circle(layer, WHITE, (cx, cy), self.radius, 2)
+        pygame.draw.circle(layer, WHITE, (cx, cy), self.radius // 1.5, 2)
         
         for i, number in enumerate(self.inner_numbers):
             angle = math.radians(i * (360 / len(self.inner_numbers)))
             x = self.center_x + (self.radius // 1.5 - 20) * math.cos(angle)
             y = self.center_y + (self.radius // 1.5 - 20) * math.sin(angle)
-            draw_text(surface, number, 30, GREEN, x, y)
+            draw_text(layer, number, 30, GREEN, x - self.rect.x, y - self.rect.y)
             
-            if suspicion_level > 80 and number == "4":
-                pygame.draw.line(surface, RED, 
-                               (self.center_x, self.center_y),
-                               (x, y), 2)
+            if number == "4":
+                self.highlight_number_pos = (x, y)
+        
+        draw_text(layer, "A/D to rotate, ENTER to close", 30, WHITE,
+                  cx, cy + self.radius + 30)
+        self.static_layer = layer
+    
+    def outer_layout(self, outer_angle):
+        # The outer ring only ever sits at a few hundred angles, so each one's glyph placement is kept
+        layout = self.outer_layouts.get(outer_angle)
+        if layout is None:
+            blits = []
+            highlight = None
+            for i, letter in enumerate(self.outer_letters):
+                angle = math.radians(outer_angle + i * (360 / len(self.outer_letters)))
+                x = self.center_x + (self.radius - 20) * math.cos(angle)
+                y = self.center_y + (self.radius - 20) * math.sin(angle)
+                glyph = text_cache.render(letter, 30, WHITE)
+                blits.append((glyph, glyph.get_rect(center=(x, y))))
+                
+                if letter == "K":
+                    highlight = (x, y)
+            layout = (blits, highlight)
+            self.outer_layouts[outer_angle] = layout
+        return layout
+    
+    def draw(self, surface, suspicion_level):
+        if not self.visible:
+            return
+        
+        if self.static_layer is None:
+            self.build_static_layer()
+        
+        surface.blit(overlays.dim(180), (0, 0))
+        surface.blit(self.static_layer, self.rect)
+        
+        blits, highlight_letter_pos = self.outer_layout(self.outer_angle)
+        surface.blits(blits, False)
+        
+        if suspicion_level > 80:
+            pygame.draw.line(surface, RED, (self.center_x, self.center_y), highlight_letter_pos, 2)
+            pygame.draw.line(surface, RED, (self.center_x, self.center_y), self.highlight_number_pos, 2)
         
         pygame.draw.circle(surface, RED, (self.center_x, self.center_y), 10)
-        draw_text(surface, "A/D to rotate, ENTER to close", 30, WHITE, 
-                 self.center_x, self.center_y + self.radius + 30)
     
-    def update(self):
-        keys = pygame.key.get_pressed()
+    def update(self, keys=None):
+        if keys is None:
+            keys = game_input.pressed()
         if keys[pygame.K_a]:
             self.outer_angle -= self.rotation_speed
         if keys[pygame.K_d]:
@@ -254,48 +992,750 @@ class SuspicionSystem:
         self.high_suspicion_threshold = 80
         self.effective_suspicion = 0
     
-    def update(self, dt, is_being_chased):
-        if is_being_chased:
-            self.suspicion = min(self.max_suspicion, self.suspicion + self.increase_rate * dt)
+    def update(self, dt, is_being_chased):
+        if is_being_chased:
+            self.suspicion = min(self.max_suspicion, self.suspicion + self.increase_rate * dt)
+        else:
+            self.suspicion = max(0, self.suspicion - self.decrease_rate * dt)
+        
+        self.effective_suspicion = self.effective_suspicion * 0.9 + self.suspicion * 0.1
+    
+    def get_suspicion_modifier(self):
+        return 1.0 + (self.suspicion / self.max_suspicion) * 0.5
+    
+    def draw_effects(self, surface):
+        if self.suspicion > self.high_suspicion_threshold:
+            intensity = min(1.0, (self.suspicion - self.high_suspicion_threshold) / 
+                        (self.max_suspicion - self.high_suspicion_threshold))
+            
+            surface.blits(overlays.suspicion_border(intensity), False)
+
+class AssetRegistry:
+    def __init__(self, sprite_dir="Sprites"):
+        self.sprite_dir = sprite_dir
+        self.images = {}
+        self.sheets = {}
+        self.audio = {}
+        self.hits = 0
+        self.misses = 0
+        self.resident_bytes = 0
+    
+    def add_image(self, key, image):
+        self.images[key] = image
+        self.resident_bytes += image.get_pitch() * image.get_height()
+        return image
+    
+    def image(self, path, placeholder=None):
+        image = self.images.get(path)
+        if image is not None:
+            self.hits += 1
+            return image
+        
+        self.misses += 1
+        try:
+            image = pygame.image.load(path).convert_alpha()
+        except (pygame.error, OSError):
+            if placeholder is None:
+                raise
+            image = placeholder()
+        return self.add_image(path, image)
+    
+    def add_audio(self, path, sound):
+        self.audio[path] = sound
+        if sound is not None:
+            frequency, size, channels = pygame.mixer.get_init()
+            self.resident_bytes += int(sound.get_length() * frequency) * channels * abs(size) // 8
+        return sound
+    
+    def sound(self, path):
+        # Tracks are kept decoded, so playing or switching them never touches the disk or the decoder
+        if path in self.audio:
+            self.hits += 1
+            return self.audio[path]
+        
+        self.misses += 1
+        try:
+            sound = pygame.mixer.Sound(path)
+        except (pygame.error, OSError) as e:
+            print(f"Could not load {path}: {e}", file=sys.stderr)
+            sound = None
+        return self.add_audio(path, sound)
+    
+    def frames(self, filename, frame_width, frame_height, cols, rows, placeholder=None, tint=None):
+        key = (filename, frame_width, frame_height, cols, rows, tint)
+        frames = self.sheets.get(key)
+        if frames is not None:
+            self.hits += 1
+            return frames
+        
+        if tint is not None:
+            # Each tint of a sheet is blended once, then shared like the sheet itself
+            frames = tuple(frame.copy() for frame in
+                           self.frames(filename, frame_width, frame_height, cols, rows, placeholder))
+            for frame in frames:
+                frame.fill(tint, special_flags=pygame.BLEND_MULT)
+                self.resident_bytes += frame.get_pitch() * frame.get_height()
+            self.sheets[key] = frames
+            return frames
+        
+        sheet = self.image(os.path.join(self.sprite_dir, filename),
+                           placeholder and (lambda: placeholder(cols, rows)))
+        
+        # Subsurfaces share the sheet's pixels, so every user of the sheet draws from one copy
+        frames = tuple(sheet.subsurface((col * frame_width, row * frame_height, frame_width, frame_height))
+                       for row in range(rows) for col in range(cols))
+        self.sheets[key] = frames
+        return frames
+    
+    def stats(self):
+        return {
+            "images": len(self.images),
+            "sheets": len(self.sheets),
+            "audio": len(self.audio),
+            "hits": self.hits,
+            "misses": self.misses,
+            "resident_bytes": self.resident_bytes,
+        }
+
+assets = AssetRegistry()
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+class AssetPreloader:
+    def __init__(self, registry, workers=4):
+        self.registry = registry
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preload")
+        self.pending = []
+        self.total = 0
+        self.done = 0
+    
+    def submit(self, kind, key, fn, *args):
+        self.pending.append((kind, key, self.executor.submit(fn, *args)))
+        self.total += 1
+    
+    def image(self, path):
+        if path not in self.registry.images:
+            self.submit("image", path, pygame.image.load, path)
+    
+    def font(self, size, face=None):
+        # SDL_ttf shares one FreeType library that is not thread-safe, and opening a face is cheap,
+        # so fonts are made here on the main thread
+        text_cache.font(size, face)
+    
+    def audio(self, path):
+        if path not in self.registry.audio and pygame.mixer.get_init():
+            self.submit("audio", path, pygame.mixer.Sound, path)
+    
+    def poll(self):
+        # Decoding happens on the workers; registering (and convert_alpha) has to happen here on the main thread
+        still_pending = []
+        for kind, key, future in self.pending:
+            if not future.done():
+                still_pending.append((kind, key, future))
+                continue
+            
+            self.done += 1
+            try:
+                result = future.result()
+            except (pygame.error, OSError) as e:
+                # The game runs on without it (a missing track plays as silence), but say so
+                print(f"Could not load {key}: {e}", file=sys.stderr)
+                if kind == "audio":
+                    self.registry.add_audio(key, None)
+                continue
+            
+            if kind == "image":
+                self.registry.add_image(key, result.convert_alpha())
+            elif kind == "audio":
+                self.registry.add_audio(key, result)
+        self.pending = still_pending
+    
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+    
+    @property
+    def finished(self):
+        return not self.pending
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.poll()
+
+def preload_game_assets(preloader):
+    preloader.image(os.path.join(assets.sprite_dir, Player.sheet_file))
+    preloader.image(os.path.join(assets.sprite_dir, Mob.sheet_file))
+    for size in FONT_SIZES:
+        preloader.font(size)
+    preloader.audio(DEFAULT_MUSIC)
+    preloader.audio(CHASE_MUSIC)
+
+def warm_sprite_sheets():
+    # Slice (or build placeholders for) every sheet now so gameplay only ever gets registry hits
+    Player.load_sprite_sheet(Player.sheet_file, Player.cols, Player.rows)
+    Mob.load_sprite_sheet(Mob.sheet_file, Mob.cols, Mob.rows)
+    Mob.load_sprite_sheet(Mob.sheet_file, Mob.cols, Mob.rows, Mob.stunned_color)
+
+def summed_area_table(grid):
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(grid, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    return table
+
+def boxes_hit_table(table, cell_width, cell_height, boxes, outside_solid=False):
+    # boxes is an (n, 4) int array of left, top, right, bottom; returns which ones touch a filled cell
+    rows = table.shape[0] - 1
+    cols = table.shape[1] - 1
+    c0 = boxes[:, 0] // cell_width
+    r0 = boxes[:, 1] // cell_height
+    c1 = (boxes[:, 2] - 1) // cell_width + 1
+    r1 = (boxes[:, 3] - 1) // cell_height + 1
+    outside = (c0 < 0) | (r0 < 0) | (c1 > cols) | (r1 > rows)
+    
+    np.clip(c0, 0, cols, out=c0)
+    np.clip(c1, 0, cols, out=c1)
+    np.clip(r0, 0, rows, out=r0)
+    np.clip(r1, 0, rows, out=r1)
+    filled = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+    
+    hit = filled > 0
+    if outside_solid:
+        hit |= outside
+    return hit
+
+class StaticCollisionGrid:
+    def __init__(self, sprites=(), cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.sprites = []
+        self.order = {}
+        self.occupancy = None
+        for sprite in sprites:
+            self.add(sprite)
+    
+    def cell_range(self, rect):
+        cs = self.cell_size
+        return (range(rect.left // cs, (rect.right - 1) // cs + 1),
+                range(rect.top // cs, (rect.bottom - 1) // cs + 1))
+    
+    def add(self, sprite):
+        self.order[id(sprite)] = len(self.sprites)
+        self.sprites.append(sprite)
+        self.occupancy = None
+        cols, rows = self.cell_range(sprite.rect)
+        for cx in cols:
+            for cy in rows:
+                self.cells.setdefault((cx, cy), []).append(sprite)
+    
+    def query(self, rect):
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+        
+        found = []
+        seen = set()
+        cols, rows = self.cell_range(rect)
+        for cx in cols:
+            for cy in rows:
+                for sprite in self.cells.get((cx, cy), ()):
+                    if id(sprite) not in seen and rect.colliderect(sprite.rect):
+                        seen.add(id(sprite))
+                        found.append(sprite)
+        return found
+    
+    def collides(self, rect):
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+        
+        cols, rows = self.cell_range(rect)
+        for cx in cols:
+            for cy in rows:
+                for sprite in self.cells.get((cx, cy), ()):
+                    if rect.colliderect(sprite.rect):
+                        return True
+        return False
+    
+    def build_occupancy(self):
+        rects = [sprite.rect for sprite in self.sprites]
+        origin_x = min((rect.left for rect in rects), default=0)
+        origin_y = min((rect.top for rect in rects), default=0)
+        
+        # Walls laid out on a common grid (multiples of 50 in main) rasterize exactly at that step
+        step = 0
+        for rect in rects:
+            for edge in (rect.left - origin_x, rect.right - origin_x, rect.top - origin_y, rect.bottom - origin_y):
+                step = math.gcd(step, edge)
+        exact = step >= 8
+        if not exact:
+            step = 16
+        
+        width = max((rect.right for rect in rects), default=origin_x) - origin_x
+        height = max((rect.bottom for rect in rects), default=origin_y) - origin_y
+        grid = np.zeros((max(1, -(-height // step)), max(1, -(-width // step))), dtype=bool)
+        for rect in rects:
+            grid[(rect.top - origin_y) // step:(rect.bottom - origin_y - 1) // step + 1,
+                 (rect.left - origin_x) // step:(rect.right - origin_x - 1) // step + 1] = True
+        
+        self.occupancy = (summed_area_table(grid), step, origin_x, origin_y, exact)
+    
+    def collides_many(self, boxes):
+        if not self.sprites:
+            return np.zeros(len(boxes), dtype=bool)
+        if self.occupancy is None:
+            self.build_occupancy()
+        
+        table, step, origin_x, origin_y, exact = self.occupancy
+        hit = boxes_hit_table(table, step, step, boxes - (origin_x, origin_y, origin_x, origin_y))
+        if not exact:
+            # The raster is conservative off-grid, so confirm the few candidates exactly
+            for i in np.flatnonzero(hit):
+                left, top, right, bottom = boxes[i].tolist()
+                hit[i] = self.collides(pygame.Rect(left, top, right - left, bottom - top))
+        return hit
+    
+    def query_ordered(self, rect):
+        # Same as query, but in insertion order so overlapping sprites draw consistently
+        found = self.query(rect)
+        found.sort(key=lambda sprite: self.order[id(sprite)])
+        return found
+    
+    def __len__(self):
+        return len(self.sprites)
+    
+    def __iter__(self):
+        return iter(self.sprites)
+
+TILE_GID_MASK = 0x1FFFFFFF  # Tiled stores flip flags in the top three bits of each gid
+
+class TileAtlas:
+    loaded = {}
+    
+    def __init__(self, image_path, tile_width, tile_height, columns, tile_count):
+        self.image = assets.image(image_path)
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        
+        # Subsurfaces share pixels with the tileset image, so slicing costs no copies
+        self.tiles = []
+        for index in range(tile_count):
+            x = (index % columns) * tile_width
+            y = (index // columns) * tile_height
+            self.tiles.append(self.image.subsurface((x, y, tile_width, tile_height)))
+    
+    @classmethod
+    def get(cls, image_path, tile_width, tile_height, columns, tile_count):
+        key = (os.path.normpath(image_path), tile_width, tile_height)
+        atlas = cls.loaded.get(key)
+        if atlas is None:
+            atlas = cls(image_path, tile_width, tile_height, columns, tile_count)
+            cls.loaded[key] = atlas
+        return atlas
+
+class TileMap:
+    def __init__(self, tiles, tile_width, tile_height, atlas, first_gid, solid, outside_solid=True, chunk_tiles=32):
+        self.tiles = tiles
+        self.rows, self.cols = tiles.shape
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.atlas = atlas
+        self.first_gid = first_gid
+        self.solid = solid
+        self.solid_table = None
+        self.outside_solid = outside_solid
+        self.width = self.cols * tile_width
+        self.height = self.rows * tile_height
+        self.chunk_tiles = chunk_tiles
+        self.chunks = {}
+    
+    @classmethod
+    def load(cls, path, solid_gids=(), void_is_solid=True):
+        root = ElementTree.parse(path).getroot()
+        base_dir = os.path.dirname(path)
+        
+        tileset = root.find("tileset")
+        if tileset.get("source"):
+            tileset_path = os.path.join(base_dir, tileset.get("source"))
+            first_gid = int(tileset.get("firstgid"))
+            tileset = ElementTree.parse(tileset_path).getroot()
+            base_dir = os.path.dirname(tileset_path)
+        else:
+            first_gid = int(tileset.get("firstgid"))
+        
+        # Tiles marked with a bool "solid" property in Tiled's tileset editor block movement
+        solid_gids = set(solid_gids)
+        for tile in tileset.findall("tile"):
+            for prop in tile.iter("property"):
+                if prop.get("name") == "solid" and prop.get("value") == "true":
+                    solid_gids.add(first_gid + int(tile.get("id")))
+        
+        tile_width = int(tileset.get("tilewidth"))
+        tile_height = int(tileset.get("tileheight"))
+        image = tileset.find("image")
+        atlas = TileAtlas.get(os.path.join(base_dir, image.get("source")), tile_width, tile_height,
+                              int(tileset.get("columns")), int(tileset.get("tilecount")))
+        
+        layer = root.find("layer")
+        width = int(layer.get("width"))
+        height = int(layer.get("height"))
+        data = layer.find("data")
+        if data.get("encoding") != "csv":
+            raise ValueError(f"{path}: only CSV-encoded tile layers are supported")
+        
+        # NumPy parses the whole CSV block in C, no per-tile Python objects
+        gids = np.fromstring(data.text, dtype=np.uint32, sep=",")
+        if gids.size != width * height:
+            raise ValueError(f"{path}: expected {width * height} tiles, found {gids.size}")
+        tiles = (gids & TILE_GID_MASK).astype(np.int32).reshape(height, width)
+        
+        solid = np.isin(tiles, np.asarray(list(solid_gids), dtype=np.int32))
+        if void_is_solid:
+            solid |= tiles == 0
+        return cls(tiles, tile_width, tile_height, atlas, first_gid, solid, void_is_solid)
+    
+    def collides(self, rect):
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+        
+        c0 = rect.left // self.tile_width
+        r0 = rect.top // self.tile_height
+        c1 = (rect.right - 1) // self.tile_width + 1
+        r1 = (rect.bottom - 1) // self.tile_height + 1
+        
+        if c0 < 0 or r0 < 0 or c1 > self.cols or r1 > self.rows:
+            if self.outside_solid:
+                return True
+            c0, r0 = max(c0, 0), max(r0, 0)
+            c1, r1 = min(c1, self.cols), min(r1, self.rows)
+            if c0 >= c1 or r0 >= r1:
+                return False
+        return bool(self.solid[r0:r1, c0:c1].any())
+    
+    def collides_many(self, boxes):
+        if self.solid_table is None:
+            self.solid_table = summed_area_table(self.solid)
+        return boxes_hit_table(self.solid_table, self.tile_width, self.tile_height, boxes, self.outside_solid)
+    
+    def get_chunk(self, cx, cy):
+        chunk = self.chunks.get((cx, cy))
+        if chunk is not None:
+            return chunk
+        
+        n = self.chunk_tiles
+        block = self.tiles[cy * n:(cy + 1) * n, cx * n:(cx + 1) * n]
+        chunk = pygame.Surface((block.shape[1] * self.tile_width, block.shape[0] * self.tile_height), pygame.SRCALPHA)
+        rows, cols = np.nonzero(block)
+        tiles = self.atlas.tiles
+        chunk.blits([(tiles[block[r, c] - self.first_gid], (c * self.tile_width, r * self.tile_height))
+                     for r, c in zip(rows.tolist(), cols.tolist())], False)
+        self.chunks[(cx, cy)] = chunk
+        return chunk
+    
+    def draw(self, surface, camera, view=None, scale=1):
+        # Tiles are pre-composited into chunks on first sight, so a frame blits a handful of surfaces
+        view = (view or camera.visible_rect).clip(pygame.Rect(0, 0, self.width, self.height))
+        if view.width <= 0 or view.height <= 0:
+            return
+        
+        chunk_w = self.chunk_tiles * self.tile_width
+        chunk_h = self.chunk_tiles * self.tile_height
+        offset_x, offset_y = camera.camera.topleft
+        for cy in range(view.top // chunk_h, (view.bottom - 1) // chunk_h + 1):
+            for cx in range(view.left // chunk_w, (view.right - 1) // chunk_w + 1):
+                surface.blit(scaled_images.get(self.get_chunk(cx, cy), scale),
+                             ((cx * chunk_w + offset_x) // scale, (cy * chunk_h + offset_y) // scale))
+
+class CollisionLayers:
+    def __init__(self, *layers):
+        self.layers = layers
+    
+    def collides(self, rect):
+        return any(layer.collides(rect) for layer in self.layers)
+    
+    def collides_many(self, boxes):
+        hit = np.zeros(len(boxes), dtype=bool)
+        for layer in self.layers:
+            hit |= layer.collides_many(boxes)
+        return hit
+
+class FlowField:
+    # Orthogonal and diagonal steps with their costs
+    steps = [(1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+             (1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)), (-1, 1, math.sqrt(2)), (-1, -1, math.sqrt(2))]
+    
+    def __init__(self, walls, width, height, agent_width, agent_height, cell_size=25, radius=480, blocked=None):
+        # blocked can come precomputed (from a compiled level); otherwise it is rasterized from the walls here
+        self.cell_size = cell_size
+        if blocked is None:
+            blocked = self.rasterize(walls, width, height, agent_width, agent_height, cell_size)
+        self.blocked = blocked
+        self.rows, self.cols = blocked.shape
+        
+        # Only chasers use the field and they give up a few hundred pixels out, so it covers a window around the goal
+        self.reach = math.ceil(radius / cell_size)
+        self.goal = None
+        self.origin = (0, 0)
+        self.next_cell = np.full((0, 0, 2), -1, dtype=np.int32)
+        self.builds = 0
+    
+    @staticmethod
+    def rasterize(walls, width, height, agent_width, agent_height, cell_size=25):
+        # A cell is open if an agent centred in it clears every wall
+        cols = math.ceil(width / cell_size)
+        rows = math.ceil(height / cell_size)
+        row_ids, col_ids = np.mgrid[0:rows, 0:cols]
+        boxes = np.empty((rows * cols, 4), dtype=np.int64)
+        boxes[:, 0] = (col_ids.ravel() * cell_size + cell_size // 2) - agent_width // 2
+        boxes[:, 1] = (row_ids.ravel() * cell_size + cell_size // 2) - agent_height // 2
+        boxes[:, 2] = boxes[:, 0] + agent_width
+        boxes[:, 3] = boxes[:, 1] + agent_height
+        return walls.collides_many(boxes).reshape(rows, cols)
+    
+    def cell_of(self, x, y):
+        return (min(max(int(x // self.cell_size), 0), self.cols - 1),
+                min(max(int(y // self.cell_size), 0), self.rows - 1))
+    
+    def update(self, x, y):
+        goal = self.cell_of(x, y)
+        if goal == self.goal:
+            return False
+        self.goal = goal
+        self.build()
+        return True
+    
+    def build(self):
+        # Dijkstra outwards from the goal; each cell remembers the neighbour it was reached from,
+        # which is its next step towards the goal
+        goal_col, goal_row = self.goal
+        left = max(0, goal_col - self.reach)
+        top = max(0, goal_row - self.reach)
+        right = min(self.cols, goal_col + self.reach + 1)
+        bottom = min(self.rows, goal_row + self.reach + 1)
+        blocked = self.blocked[top:bottom, left:right].tolist()
+        width = right - left
+        height = bottom - top
+        
+        dist = [[math.inf] * width for _ in range(height)]
+        next_cell = [[(-1, -1)] * width for _ in range(height)]
+        start = (goal_col - left, goal_row - top)
+        dist[start[1]][start[0]] = 0.0
+        heap = [(0.0, start)]
+        while heap:
+            d, (col, row) = heapq.heappop(heap)
+            if d > dist[row][col]:
+                continue
+            # Blocked cells get a way out but are never passed through
+            if blocked[row][col] and (col, row) != start:
+                continue
+            for dc, dr, cost in self.steps:
+                c = col + dc
+                r = row + dr
+                if not (0 <= c < width and 0 <= r < height):
+                    continue
+                # No cutting corners past a wall
+                if dc and dr and (blocked[row][c] or blocked[r][col]):
+                    continue
+                nd = d + cost
+                if nd < dist[r][c]:
+                    dist[r][c] = nd
+                    next_cell[r][c] = (col + left, row + top)
+                    heapq.heappush(heap, (nd, (c, r)))
+        
+        self.origin = (left, top)
+        self.next_cell = np.array(next_cell, dtype=np.int32).reshape(height, width, 2)
+        self.builds += 1
+    
+    def sample(self, pos):
+        # The point each position should head for next: the centre of the following cell on its path.
+        # ok is False in the goal cell and wherever the field has no path
+        cols = np.floor(pos[:, 0] / self.cell_size).astype(np.int64) - self.origin[0]
+        rows = np.floor(pos[:, 1] / self.cell_size).astype(np.int64) - self.origin[1]
+        height, width = self.next_cell.shape[:2]
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        
+        targets = np.zeros((len(pos), 2), dtype=np.float64)
+        targets[inside] = self.next_cell[rows[inside], cols[inside]]
+        ok = inside & (targets[:, 0] >= 0)
+        targets = (targets + 0.5) * self.cell_size
+        return targets, ok
+
+class ImageScaler:
+    # Shrunk copies of world images for a low-resolution world pass, made the first time each is drawn.
+    # Entries keep their source alive, so an id is never reused while it is a key
+    def __init__(self):
+        self.images = {}
+        self.frame_lists = {}
+    
+    def get(self, image, scale):
+        if scale == 1:
+            return image
+        key = (id(image), scale)
+        entry = self.images.get(key)
+        if entry is None:
+            width, height = image.get_size()
+            size = (max(1, width // scale), max(1, height // scale))
+            if image.get_bitsize() >= 24:
+                small = pygame.transform.smoothscale(image, size)
+            else:
+                small = pygame.transform.scale(image, size)
+            entry = self.images[key] = (image, small)
+        return entry[1]
+    
+    def frames(self, frames, scale):
+        key = (id(frames), scale)
+        entry = self.frame_lists.get(key)
+        if entry is None:
+            entry = self.frame_lists[key] = (frames, [self.get(frame, scale) for frame in frames])
+        return entry[1]
+
+scaled_images = ImageScaler()
+
+class RenderTarget:
+    # An off-screen surface at 1/scale of the window's resolution for the world pass, scaled up once per frame
+    def __init__(self, size, scale):
+        width, height = size
+        if width % scale or height % scale:
+            raise ValueError(f"render scale {scale} does not divide the screen size {width}x{height}")
+        self.scale = scale
+        self.surface = pygame.Surface((width // scale, height // scale)).convert()
+    
+    def align(self, area):
+        # Widens a screen rect to whole target pixels
+        s = self.scale
+        left = area.left // s * s
+        top = area.top // s * s
+        return pygame.Rect(left, top, -(-area.right // s) * s - left, -(-area.bottom // s) * s - top)
+    
+    def covering(self, area):
+        # The part of the target behind an aligned screen rect
+        s = self.scale
+        return pygame.Rect(area.x // s, area.y // s, area.width // s, area.height // s)
+    
+    def present(self, surface, area=None):
+        if area is None:
+            pygame.transform.scale(self.surface, surface.get_size(), surface)
+        elif area.width > 0 and area.height > 0:
+            pygame.transform.scale(self.surface.subsurface(self.covering(area)), area.size, surface.subsurface(area))
+
+class WorldRenderer:
+    def __init__(self, scenery, actors, tile_map=None, swarm=None):
+        self.scenery = scenery
+        self.actors = actors
+        self.tile_map = tile_map
+        self.swarm = swarm
+        self.drawn = 0
+        self.culled = 0
+    
+    def draw(self, surface, camera, area=None, alpha=1.0, scale=1):
+        # area limits drawing to part of the screen, for partial redraws
+        # alpha places moving sprites between the last two simulation ticks
+        # scale > 1 draws onto a surface that much smaller than the screen (area stays in screen pixels)
+        view = camera.visible_rect
+        if area is not None:
+            view = view.clip(camera.to_world(area))
+        offset_x, offset_y = camera.camera.topleft
+        
+        if self.tile_map:
+            self.tile_map.draw(surface, camera, view, scale)
+        
+        # Scenery is static, so only sprites in the cells under the view are touched
+        visible = self.scenery.query_ordered(view)
+        if scale == 1:
+            for sprite in visible:
+                surface.blit(sprite.image, sprite.rect.move(offset_x, offset_y))
         else:
-            self.suspicion = max(0, self.suspicion - self.decrease_rate * dt)
+            for sprite in visible:
+                surface.blit(scaled_images.get(sprite.image, scale),
+                             ((sprite.rect.x + offset_x) // scale, (sprite.rect.y + offset_y) // scale))
+        drawn = len(visible)
         
-        self.effective_suspicion = self.effective_suspicion * 0.9 + self.suspicion * 0.1
+        for sprite in self.actors:
+            rect = sprite.render_rect(alpha)
+            if view.colliderect(rect):
+                surface.blit(scaled_images.get(sprite.image, scale),
+                             ((rect.x + offset_x) // scale, (rect.y + offset_y) // scale))
+                drawn += 1
+        
+        total = len(self.scenery) + len(self.actors)
+        if self.swarm:
+            drawn += self.swarm.draw(surface, camera, view, alpha, scale)
+            total += len(self.swarm)
+        
+        self.drawn = drawn
+        self.culled = total - drawn
+
+class DirtyRectRenderer:
+    # align widens a dirty rect to what will actually be repainted, e.g. whole low-resolution pixels
+    def __init__(self, enabled=False, align=None, max_rects=64, max_coverage=0.5):
+        self.enabled = enabled
+        self.align = align
+        self.max_rects = max_rects
+        self.max_coverage = max_coverage
+        self.previous_offset = None
+        self.previous_rects = []
+        self.previous_hud = {}
+        self.previous_full_key = None
+        self.force_full = True
+        self.full_frames = 0
+        self.partial_frames = 0
     
-    def get_suspicion_modifier(self):
-        return 1.0 + (self.suspicion / self.max_suspicion) * 0.5
+    def invalidate(self):
+        self.force_full = True
     
-    def draw_effects(self, surface):
-        if self.suspicion > self.high_suspicion_threshold:
-            intensity = min(1.0, (self.suspicion - self.high_suspicion_threshold) / 
-                        (self.max_suspicion - self.high_suspicion_threshold))
+    def merge(self, rects):
+        merged = []
+        for rect in sorted(rects, key=lambda r: (r.top, r.left)):
+            for i, other in enumerate(merged):
+                if rect.colliderect(other):
+                    merged[i] = other.union(rect)
+                    break
+            else:
+                merged.append(rect)
+        return merged
+    
+    def present(self, surface, draw_frame, camera_offset, moving_rects, hud, full_key=None):
+        # hud maps a widget name to (value, screen rect); a widget is redrawn only when its value changes
+        full = (not self.enabled or self.force_full or camera_offset != self.previous_offset
+                or full_key != self.previous_full_key)
+        
+        dirty = []
+        if not full:
+            dirty = self.previous_rects + moving_rects
+            for name, (value, rect) in hud.items():
+                previous = self.previous_hud.get(name)
+                if previous is None or previous[0] != value:
+                    dirty.append(rect)
+            if self.align is not None:
+                # Clip to, and update, the area the upscale writes, so the HUD is redrawn over all of it
+                dirty = [self.align(rect) for rect in dirty]
+            dirty = [rect.clip(surface.get_rect()) for rect in self.merge(dirty)]
+            dirty = [rect for rect in dirty if rect.width > 0 and rect.height > 0]
             
-            border_size = int(10 * intensity)
-            if border_size > 0:
-                border = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-                pygame.draw.rect(border, (255, 0, 0, int(150 * intensity)), 
-                                (0, 0, SCREEN_WIDTH, border_size))
-                pygame.draw.rect(border, (255, 0, 0, int(150 * intensity)), 
-                                (0, SCREEN_HEIGHT - border_size, SCREEN_WIDTH, border_size))
-                pygame.draw.rect(border, (255, 0, 0, int(150 * intensity)), 
-                                (0, 0, border_size, SCREEN_HEIGHT))
-                pygame.draw.rect(border, (255, 0, 0, int(150 * intensity)), 
-                                (SCREEN_WIDTH - border_size, 0, border_size, SCREEN_HEIGHT))
-                surface.blit(border, (0, 0))
-        
-        meter_width = 200
-        meter_height = 20
-        meter_x = SCREEN_WIDTH - meter_width - 20
-        meter_y = 20
-        
-        pygame.draw.rect(surface, (50, 50, 50), (meter_x, meter_y, meter_width, meter_height))
-        pygame.draw.rect(surface, (255, 0, 0), 
-                        (meter_x, meter_y, meter_width * (self.suspicion / self.max_suspicion), meter_height))
-        pygame.draw.rect(surface, WHITE, (meter_x, meter_y, meter_width, meter_height), 2)
-        
-        font = pygame.font.Font(None, 24)
-        text = font.render("SUSPICION", True, WHITE)
-        surface.blit(text, (meter_x, meter_y + 25))
+            area = sum(rect.width * rect.height for rect in dirty)
+            if len(dirty) > self.max_rects or area > self.max_coverage * surface.get_width() * surface.get_height():
+                full = True
+        
+        if full:
+            draw_frame(surface, None)
+            with profiler.section("flip"):
+                pygame.display.flip()
+            self.full_frames += 1
+        elif dirty:
+            for rect in dirty:
+                surface.set_clip(rect)
+                draw_frame(surface, rect)
+            surface.set_clip(None)
+            with profiler.section("flip"):
+                pygame.display.update(dirty)
+            self.partial_frames += 1
+        # Running totals, so an export shows how often the camera forced a full redraw
+        profiler.count("full_frames", self.full_frames)
+        profiler.count("partial_frames", self.partial_frames)
+        
+        self.force_full = False
+        self.previous_offset = camera_offset
+        self.previous_rects = moving_rects
+        self.previous_hud = hud
+        self.previous_full_key = full_key
 
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
@@ -322,7 +1762,7 @@ class Sign(pygame.sprite.Sprite):
         return self.normal_text
 
 class CodeTerminal(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+    def __init__(self, x, y, code="8514"):
         super().__init__()
         self.image = pygame.Surface((60, 80))
         self.image.fill(PURPLE)
@@ -330,26 +1770,78 @@ class CodeTerminal(pygame.sprite.Sprite):
         draw_text(self.image, "CODE", 20, WHITE, 30, 40)
         self.rect = self.image.get_rect(topleft=(x, y))
         self.interact_rect = pygame.Rect(x - 40, y - 40, 140, 160)
+        self.code = code
 
-class MusicPlayer:
-    def __init__(self, music_file):
-        pygame.mixer.init()
-        self.music_file = music_file
-        self.is_playing = False
-
-    def play(self):
-        if not self.is_playing:
-            pygame.mixer.music.load(self.music_file)
-            pygame.mixer.music.play(-1)
-            self.is_playing = True
-
+class AudioManager:
+    # Default and chase music sit decoded on two reserved channels; a chase edge is a volume crossfade,
+    # not a load, so it costs nothing mid-frame
+    def __init__(self, default_track, chase_track, fade_time=0.8, chase_delay=0.2, calm_delay=1.5):
+        self.enabled = pygame.mixer.get_init() is not None
+        self.tracks = [assets.sound(default_track), assets.sound(chase_track)] if self.enabled else [None, None]
+        if self.enabled:
+            pygame.mixer.set_reserved(2)
+            self.channels = [pygame.mixer.Channel(0), pygame.mixer.Channel(1)]
+        self.fade_time = fade_time
+        self.chase_delay = chase_delay
+        self.calm_delay = calm_delay
+        self.volume = 1.0
+        self.levels = [0.0, 0.0]
+        self.chasing = False
+        self.pending = 0.0
+        self.playing = False
+        self.switches = 0
+    
+    def start(self):
+        self.chasing = False
+        self.pending = 0.0
+        self.levels = [0.0, 0.0]
+        self.playing = True
+        self.fade_to(0, 1.0)
+    
     def stop(self):
-        if self.is_playing:
-            pygame.mixer.music.stop()
-            self.is_playing = False
-
-    def set_volume(self, volume):
-        pygame.mixer.music.set_volume(volume)
+        if self.enabled:
+            for channel in self.channels:
+                channel.stop()
+        self.levels = [0.0, 0.0]
+        self.playing = False
+    
+    def fade_to(self, i, level):
+        if not self.enabled or self.tracks[i] is None:
+            self.levels[i] = level
+            return
+        
+        channel = self.channels[i]
+        if level > 0 and self.levels[i] == 0:
+            # A track coming in starts from the top, like it used to
+            channel.play(self.tracks[i], loops=-1)
+        elif level == 0:
+            channel.stop()
+        channel.set_volume(level * self.volume)
+        self.levels[i] = level
+    
+    def update(self, dt, chasing):
+        if not self.playing:
+            return
+        
+        # The music only follows a chase state that holds for a moment, so mobs flickering at the edge
+        # of chase range don't flap it back and forth
+        if chasing != self.chasing:
+            self.pending += dt
+            if self.pending >= (self.chase_delay if chasing else self.calm_delay):
+                self.chasing = chasing
+                self.pending = 0.0
+                self.switches += 1
+        else:
+            self.pending = 0.0
+        
+        targets = (0.0, 1.0) if self.chasing else (1.0, 0.0)
+        step = dt / self.fade_time
+        for i, target in enumerate(targets):
+            level = self.levels[i]
+            if level < target:
+                self.fade_to(i, min(target, level + step))
+            elif level > target:
+                self.fade_to(i, max(target, level - step))
 
 class AnimatedSprite(pygame.sprite.Sprite):
     def __init__(self, position, frames, animation_speed=0.1):
@@ -361,8 +1853,10 @@ class AnimatedSprite(pygame.sprite.Sprite):
         self.image = frames[self.current_frame]
         self.rect = self.image.get_rect(center=position)
         self.pos = pygame.Vector2(position)
+        self.prev_pos = self.pos.copy()
         self.direction = pygame.Vector2(0, 0)
         self.speed = PLAYER_SPEED
+        self.bounds = pygame.Rect(0, 0, WORLD_WIDTH, WORLD_HEIGHT)
         
     def update(self, dt):
         self.animation_time += dt
@@ -378,19 +1872,26 @@ class AnimatedSprite(pygame.sprite.Sprite):
         self.pos += self.direction * self.speed * dt
         self.rect.center = self.pos
         
-        self.rect.clamp_ip(pygame.Rect(0, 0, WORLD_WIDTH, WORLD_HEIGHT))
+        self.rect.clamp_ip(self.bounds)
         self.pos.x, self.pos.y = self.rect.center
         
         return old_pos
+    
+    def render_rect(self, alpha=1.0):
+        if alpha >= 1.0:
+            return self.rect
+        pos = self.prev_pos.lerp(self.pos, alpha)
+        return self.rect.move(round(pos.x - self.pos.x), round(pos.y - self.pos.y))
 
 class Player(AnimatedSprite):
+    sheet_file = "player.png"
+    sprite_width = 80
+    sprite_height = 120
+    cols = 2
+    rows = 4
+    
     def __init__(self, x, y):
-        self.sprite_width = 80
-        self.sprite_height = 120
-        self.cols = 2
-        self.rows = 4
-        
-        sprite_sheet = self.load_sprite_sheet("player.png", self.cols, self.rows)
+        sprite_sheet = self.load_sprite_sheet(self.sheet_file, self.cols, self.rows)
         
         self.animations = {
             "down": sprite_sheet[0:2],
@@ -410,38 +1911,51 @@ class Player(AnimatedSprite):
         self.stun_duration = 3.0
         self.stun_cooldown_time = 5.0
         
-    def load_sprite_sheet(self, filename, cols, rows):
-        try:
-            full_path = os.path.join("Sprites", filename)
-            sprite_sheet = pygame.image.load(full_path).convert_alpha()
-        except:
-            sprite_sheet = pygame.Surface((cols * self.sprite_width, rows * self.sprite_height), pygame.SRCALPHA)
-            for row in range(rows):
-                for col in range(cols):
-                    x = col * self.sprite_width
-                    y = row * self.sprite_height
-                    color = (row * 60 % 255, 100 + col * 30 % 155, 50 + (row + col) * 20 % 205)
-                    pygame.draw.rect(sprite_sheet, color, (x, y, self.sprite_width, self.sprite_height))
-                    pygame.draw.rect(sprite_sheet, BLACK, (x, y, self.sprite_width, self.sprite_height), 1)
-                    font = pygame.font.SysFont(None, 20)
-                    direction = ["Down", "Left", "Right", "Up"][row]
-                    text = font.render(f"{direction} {col+1}", True, BLACK)
-                    sprite_sheet.blit(text, (x + 5, y + 5))
-        
-        frames = []
+    @classmethod
+    def load_sprite_sheet(cls, filename, cols, rows):
+        return assets.frames(filename, cls.sprite_width, cls.sprite_height, cols, rows, cls.draw_placeholder_sheet)
+    
+    @classmethod
+    def draw_placeholder_sheet(cls, cols, rows):
+        sprite_sheet = pygame.Surface((cols * cls.sprite_width, rows * cls.sprite_height), pygame.SRCALPHA)
         for row in range(rows):
             for col in range(cols):
-                frame = pygame.Surface((self.sprite_width, self.sprite_height), pygame.SRCALPHA)
-                frame.blit(sprite_sheet, (0, 0),
-                          (col * self.sprite_width,
-                           row * self.sprite_height,
-                           self.sprite_width,
-                           self.sprite_height))
-                frames.append(frame)
-        return frames
+                x = col * cls.sprite_width
+                y = row * cls.sprite_height
+                color = (row * 60 % 255, 100 + col * 30 % 155, 50 + (row + col) * 20 % 205)
+                pygame.draw.rect(sprite_sheet, color, (x, y, cls.sprite_width, cls.sprite_height))
+                pygame.draw.rect(sprite_sheet, BLACK, (x, y, cls.sprite_width, cls.sprite_height), 1)
+                direction = ["Down", "Left", "Right", "Up"][row]
+                text = text_cache.render(f"{direction} {col+1}", 20, BLACK)
+                sprite_sheet.blit(text, (x + 5, y + 5))
+        return sprite_sheet
     
-    def update(self, dt, walls, signs, terminal, mobs=None, camera=None):
-        keys = pygame.key.get_pressed()
+    def capture(self, state):
+        state["pos"] = (self.pos.x, self.pos.y)
+        state["prev_pos"] = (self.prev_pos.x, self.prev_pos.y)
+        state["direction"] = (self.direction.x, self.direction.y)
+        state["frames"] = self.frames
+        state["animation"] = (self.current_frame, self.animation_time, self.current_animation, self.last_direction)
+        state["stun_cooldown"] = self.stun_cooldown
+        return state
+    
+    def restore(self, state):
+        self.pos.update(state["pos"])
+        self.prev_pos.update(state["prev_pos"])
+        self.direction.update(state["direction"])
+        self.rect.center = self.pos
+        self.frames = state["frames"]
+        self.current_frame, self.animation_time, self.current_animation, self.last_direction = state["animation"]
+        self.image = self.frames[self.current_frame]
+        self.stun_cooldown = state["stun_cooldown"]
+        # Recomputed by the next update
+        self.can_interact = False
+        self.near_sign = None
+        self.near_terminal = None
+    
+    def update(self, dt, walls, signs, terminals, mobs=None, camera=None, keys=None):
+        if keys is None:
+            keys = game_input.pressed()
         move_vec = pygame.Vector2(0, 0)
         
         if keys[pygame.K_w] or keys[pygame.K_UP]:
@@ -479,8 +1993,7 @@ class Player(AnimatedSprite):
         
         old_pos = super().update(dt)
         
-        wall_collisions = pygame.sprite.spritecollide(self, walls, False)
-        if wall_collisions:
+        if walls.collides(self.rect):
             self.pos = old_pos
             self.rect.center = self.pos
         
@@ -496,345 +2009,1181 @@ class Player(AnimatedSprite):
                 self.near_sign = sign
                 break
         
-        # Check terminal
-        if terminal and self.rect.colliderect(terminal.interact_rect):
-            self.can_interact = True
-            self.near_terminal = terminal
+        # Check terminals
+        for terminal in terminals:
+            if self.rect.colliderect(terminal.interact_rect):
+                self.can_interact = True
+                self.near_terminal = terminal
+                break
         
         if self.stun_cooldown > 0:
             self.stun_cooldown -= dt
     
     def stun_nearby_mobs(self, mobs):
-        for mob in mobs:
-            dx = mob.rect.centerx - self.rect.centerx
-            dy = mob.rect.centery - self.rect.centery
-            distance = math.sqrt(dx**2 + dy**2)
-            
-            if distance <= self.stun_radius:
-                mob.get_stunned(self.stun_duration)
+        mobs.stun_within(self.rect.centerx, self.rect.centery, self.stun_radius, self.stun_duration)
 
-class Mob(AnimatedSprite):
-    def __init__(self, x, y):
-        self.sprite_width = 42
-        self.sprite_height = 48
-        self.cols = 12
-        self.rows = 1
+class Mob(pygame.sprite.Sprite):
+    sheet_file = "enemy.png"
+    sprite_width = 42
+    sprite_height = 48
+    cols = 12
+    rows = 1
+    normal_color = (255, 255, 255)
+    stunned_color = (100, 100, 255)
+    
+    def __init__(self, swarm, index):
+        super().__init__()
+        self.swarm = swarm
+        self.index = index
+        
+        sprite_sheet = self.load_sprite_sheet(self.sheet_file, self.cols, self.rows)
+        
+        self.animations = {
+            "right": sprite_sheet
+        }
+        self.frames = self.animations["right"]
 
-        self.chasing = False
+    @classmethod
+    def load_sprite_sheet(cls, filename, cols, rows, tint=None):
+        if tint == cls.normal_color:
+            tint = None
+        return assets.frames(filename, cls.sprite_width, cls.sprite_height, cols, rows, cls.draw_placeholder_sheet, tint)
+    
+    @classmethod
+    def draw_placeholder_sheet(cls, cols, rows):
+        # Create placeholder sprite sheet
+        sprite_sheet = pygame.Surface((cols * cls.sprite_width, rows * cls.sprite_height), pygame.SRCALPHA)
+        for col in range(cols):
+            x = col * cls.sprite_width
+            y = 0
+            color = (100 + col * 10 % 155, 50 + col * 20 % 205, 150 + col * 5 % 105)
+            pygame.draw.rect(sprite_sheet, color, (x, y, cls.sprite_width, cls.sprite_height))
+            pygame.draw.rect(sprite_sheet, (0, 0, 0), (x, y, cls.sprite_width, cls.sprite_height), 1)
+            text = text_cache.render(f"Frame {col+1}", 20, (0, 0, 0))
+            sprite_sheet.blit(text, (x + 5, y + 5))
+        return sprite_sheet
+    
+    # Mobs are views into their swarm's arrays; all per-frame state lives there
+    @property
+    def pos(self):
+        return pygame.Vector2(self.swarm.pos[self.index].tolist())
+    
+    @property
+    def rect(self):
+        x, y = self.swarm.pos[self.index].tolist()
+        return pygame.Rect(int(math.floor(x)) - self.sprite_width // 2, int(math.floor(y)) - self.sprite_height // 2,
+                           self.sprite_width, self.sprite_height)
+    
+    @property
+    def image(self):
+        return self.frames[self.swarm.frame[self.index]]
+    
+    @property
+    def chasing(self):
+        return bool(self.swarm.chasing[self.index])
+    
+    @property
+    def stunned(self):
+        return bool(self.swarm.stunned[self.index])
+    
+    @property
+    def speed(self):
+        return float(self.swarm.speed[self.index])
+
+class SwarmGrid:
+    # Uniform grid over mob centres kept as a counting sort: order lists mob indices grouped by cell, and
+    # cell c's mobs are order[starts[c]:starts[c + 1]]. A query gathers one contiguous run per grid row
+    def __init__(self, world_width, world_height, cell_size=64):
+        self.cell_size = cell_size
+        self.inverse = 1 / cell_size
+        self.cols = max(1, math.ceil(world_width / cell_size))
+        self.rows = max(1, math.ceil(world_height / cell_size))
+        self.limits = np.array([self.cols - 1, self.rows - 1], dtype=np.int32)
+        # numpy sorts 16-bit keys with a radix sort, an order of magnitude faster than 64-bit ones
+        self.cell_type = np.uint16 if self.cols * self.rows <= 1 << 16 else np.int64
+        self.cells = np.zeros(0, dtype=self.cell_type)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(self.cols * self.rows + 1, dtype=np.int64)
+        self.sorts = 0
+    
+    def cell_of(self, x, y):
+        # Queries must bin exactly as update does, truncating x / cell_size, for no mob to fall between cells
+        return (min(max(int(x * self.inverse), 0), self.cols - 1),
+                min(max(int(y * self.inverse), 0), self.rows - 1))
+    
+    def update(self, pos):
+        binned = np.empty(pos.shape, dtype=np.int32)
+        np.multiply(pos, self.inverse, out=binned, casting="unsafe")
+        np.clip(binned, 0, self.limits, out=binned)
+        cells = binned[:, 1] * self.cols
+        cells += binned[:, 0]
+        cells = cells.astype(self.cell_type)
+        # Most ticks most mobs stay in their cell; only a change of cell needs a new sort
+        if np.array_equal(cells, self.cells):
+            return
+        self.cells = cells
+        self.order = np.argsort(cells, kind="stable")
+        np.cumsum(np.bincount(cells, minlength=self.cols * self.rows), out=self.starts[1:])
+        self.sorts += 1
+    
+    def block(self, left_col, top_row, right_col, bottom_row):
+        # Mobs in a block of cells, inclusive; the block is clipped to the grid
+        left_col = max(left_col, 0)
+        top_row = max(top_row, 0)
+        right_col = min(right_col, self.cols - 1)
+        bottom_row = min(bottom_row, self.rows - 1)
+        if left_col > right_col or top_row > bottom_row:
+            return self.order[:0]
+        starts = self.starts
+        order = self.order
+        runs = [order[starts[row * self.cols + left_col]:starts[row * self.cols + right_col + 1]]
+                for row in range(top_row, bottom_row + 1)]
+        return runs[0] if len(runs) == 1 else np.concatenate(runs)
+    
+    def candidates(self, left, top, right, bottom):
+        # At least every mob whose centre lies in [left, right) x [top, bottom)
+        left_col, top_row = self.cell_of(left, top)
+        right_col, bottom_row = self.cell_of(right, bottom)
+        return self.block(left_col, top_row, right_col, bottom_row)
+    
+    def ring(self, col, row, radius):
+        # Mobs in the cells exactly radius cells away from (col, row)
+        if radius == 0:
+            return self.block(col, row, col, row)
+        return np.concatenate([
+            self.block(col - radius, row - radius, col + radius, row - radius),
+            self.block(col - radius, row + radius, col + radius, row + radius),
+            self.block(col - radius, row - radius + 1, col - radius, row + radius - 1),
+            self.block(col + radius, row - radius + 1, col + radius, row + radius - 1),
+        ])
+
+class MobSwarm:
+    # Per-mob arrays: the shape of one mob's entry and its type
+    fields = {
+        "pos": ((2,), np.float64),
+        "prev_pos": ((2,), np.float64),
+        "direction": ((2,), np.float64),
+        "speed": ((), np.float64),
+        "base_speed": ((), np.float64),
+        "chase_speed": ((), np.float64),
+        "base_chase_speed": ((), np.float64),
+        "stun_timer": ((), np.float64),
+        "animation_time": ((), np.float64),
+        "chasing": ((), bool),
+        "stunned": ((), bool),
+        "frame": ((), np.int32),
+        "frame_count": ((), np.int32),
+        "pending_dt": ((), np.float64),
+        "tick_dt": ((), np.float64),
+    }
+    
+    def __init__(self, capacity=64, world_width=WORLD_WIDTH, world_height=WORLD_HEIGHT):
+        self.count = 0
+        self.mobs = []
+        self.world_width = world_width
+        self.world_height = world_height
+        self.sprite_width = Mob.sprite_width
+        self.sprite_height = Mob.sprite_height
+        self.animation_speed = 0.1
         self.chase_distance = 200
-        self.base_speed = 100
-        self.base_chase_speed = 150
-        self.speed = self.base_speed
-        self.chase_speed = self.base_chase_speed
+        self.base_speed_default = 100
+        self.base_chase_speed_default = 150
+        # Level of detail: mobs near the player, on screen, chasing or stunned run every tick; mobs out to
+        # sleep_radius run every throttle_every ticks on their accumulated time; the rest are frozen
+        self.lod = MOB_LOD
+        self.wake_radius = 500
+        self.sleep_radius = 1500
+        self.throttle_every = 4
+        self.ticks = 0
+        self.active_count = 0
+        self.throttled_count = 0
+        self.asleep_count = 0
+        # Proximity queries go through the grid, so they cost per nearby mob rather than per mob
+        self.grid = SwarmGrid(world_width, world_height)
+        self.grid_stale = True
+        self.capacity = 0
+        self.allocate(capacity)
+    
+    def new_array(self, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+    
+    def allocate(self, capacity):
+        for name, (shape, dtype) in self.fields.items():
+            array = self.new_array((capacity, *shape), dtype)
+            if self.capacity:
+                array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        self.capacity = capacity
+    
+    def spawn(self, x, y):
+        if self.count == self.capacity:
+            self.allocate(self.capacity * 2)
         
-        # Randomize animation start for each mob
-        self.animation_speed = 0.1
-        self.animation_time = random.uniform(0, self.animation_speed * 12)
+        i = self.count
+        self.count += 1
+        self.pos[i] = (x, y)
+        self.prev_pos[i] = (x, y)
+        self.direction[i] = (0, 0)
+        self.base_speed[i] = self.base_speed_default
+        self.base_chase_speed[i] = self.base_chase_speed_default
+        self.speed[i] = self.base_speed_default
+        self.chase_speed[i] = self.base_chase_speed_default
+        self.stun_timer[i] = 0
+        self.animation_time[i] = 0
+        self.chasing[i] = False
+        self.stunned[i] = False
+        self.pending_dt[i] = 0
+        self.tick_dt[i] = 0
+        
+        self.grid_stale = True
+        
+        mob = Mob(self, i)
+        self.mobs.append(mob)
+        self.frame_count[i] = len(mob.frames)
+        self.frame[i] = rng.randrange(len(mob.frames))  # Random starting frame
+        return mob
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        return iter(self.mobs)
+    
+    def boxes(self, pos=None):
+        if pos is None:
+            pos = self.pos[:self.count]
+        boxes = np.empty((len(pos), 4), dtype=np.int64)
+        boxes[:, 0] = np.floor(pos[:, 0]) - self.sprite_width // 2
+        boxes[:, 1] = np.floor(pos[:, 1]) - self.sprite_height // 2
+        boxes[:, 2] = boxes[:, 0] + self.sprite_width
+        boxes[:, 3] = boxes[:, 1] + self.sprite_height
+        return boxes
+    
+    def render_pos(self, alpha=1.0, ids=None):
+        if ids is None:
+            ids = slice(0, self.count)
+        pos = self.pos[ids]
+        if alpha >= 1.0:
+            return pos
+        prev = self.prev_pos[ids]
+        return prev + (pos - prev) * alpha
+    
+    def spatial_index(self):
+        if self.grid_stale:
+            self.grid.update(self.pos[:self.count])
+            self.grid_stale = False
+        profiler.count("grid_sorts", self.grid.sorts)
+        return self.grid
+    
+    def snap(self):
+        self.prev_pos[:self.count] = self.pos[:self.count]
+    
+    @property
+    def any_chasing(self):
+        n = self.count
+        return bool((self.chasing[:n] & ~self.stunned[:n]).any())
+    
+    def schedule(self, dt, target, view=None):
+        # Picks the mobs to advance this tick, leaving each one's time step in tick_dt, and counts the tiers.
+        # Only mobs within sleep_radius are classified, but the grid query re-bins every mob after a tick
+        # that moved any, and tick_dt is cleared for all of them: asleep mobs still cost a few vectorised passes
+        n = self.count
+        self.ticks += 1
+        if not self.lod:
+            self.tick_dt[:n] = dt
+            self.active_count, self.throttled_count, self.asleep_count = n, 0, 0
+            return slice(0, n)
         
-        self.stunned = False
-        self.stun_timer = 0
-        self.normal_color = (255, 255, 255)
-        self.stunned_color = (100, 100, 255)
+        # Nothing beyond sleep_radius can be chasing or stunned: a chase ends at 1.5x chase_distance and
+        # the player can't outrun a stun by that much
+        awake = self.within(target[0], target[1], self.sleep_radius)
+        offset = self.pos[awake] - target
+        active = np.hypot(offset[:, 0], offset[:, 1]) <= self.wake_radius
+        active |= self.chasing[awake] | self.stunned[awake]
+        if view is not None:
+            boxes = self.boxes(self.pos[awake])
+            active |= ((boxes[:, 0] < view.right) & (boxes[:, 2] > view.left) &
+                       (boxes[:, 1] < view.bottom) & (boxes[:, 3] > view.top))
+        # Throttled mobs take turns so the same share of them runs every tick
+        due = active | ((awake + self.ticks) % self.throttle_every == 0)
         
-        sprite_sheet = self.load_sprite_sheet("enemy.png", self.cols, self.rows)
+        ids = awake[due]
+        self.pending_dt[awake] += dt
+        self.tick_dt[:n] = 0
+        self.tick_dt[ids] = self.pending_dt[ids]
+        self.pending_dt[ids] = 0
         
-        self.animations = {
-            "right": sprite_sheet
-        }
+        self.active_count = int(np.count_nonzero(active))
+        self.throttled_count = awake.size - self.active_count
+        self.asleep_count = n - awake.size
+        return ids
+    
+    def update(self, dt, player, walls, flow=None, view=None):
+        n = self.count
+        if n == 0:
+            return False
         
-        super().__init__((x, y), self.animations["right"])
-        self.current_frame = random.randint(0, 11)  # Random starting frame
-
-    def load_sprite_sheet(self, filename, cols, rows):
-        try:
-            full_path = os.path.join("Sprites", filename)
-            sprite_sheet = pygame.image.load(full_path).convert_alpha()
-        except:
-            # Create placeholder sprite sheet
-            sprite_sheet = pygame.Surface((cols * self.sprite_width, rows * self.sprite_height), pygame.SRCALPHA)
-            for col in range(cols):
-                x = col * self.sprite_width
-                y = 0
-                color = (100 + col * 10 % 155, 50 + col * 20 % 205, 150 + col * 5 % 105)
-                pygame.draw.rect(sprite_sheet, color, (x, y, self.sprite_width, self.sprite_height))
-                pygame.draw.rect(sprite_sheet, (0, 0, 0), (x, y, self.sprite_width, self.sprite_height), 1)
-                font = pygame.font.SysFont(None, 20)
-                text = font.render(f"Frame {col+1}", True, (0, 0, 0))
-                sprite_sheet.blit(text, (x + 5, y + 5))
+        ids = self.schedule(dt, player.rect.center, view)
+        self.restore_tint(self.step(ids, self.tick_dt[ids], player.rect.center, walls, flow))
+        self.grid_stale = True
+        return self.any_chasing
+    
+    def step(self, ids, dt, target, walls, flow=None):
+        # Advances the mobs in ids (a slice from 0, or an index array) one tick and returns those whose stun ran out.
+        # dt is a number or one time step per mob, for throttled mobs catching up on several ticks at once.
+        # Nothing here touches pygame, so worker processes can run it on their part of the swarm
+        pos = self.pos[ids]
+        dt = np.broadcast_to(dt, pos.shape[:1])
+        direction = self.direction[ids]
+        speed = self.speed[ids]
+        chasing = self.chasing[ids]
+        stunned = self.stunned[ids]
+        stun_timer = self.stun_timer[ids]
+        animation_time = self.animation_time[ids]
+        frame = self.frame[ids]
         
-        frames = []
-        for col in range(cols):
-            frame = pygame.Surface((self.sprite_width, self.sprite_height), pygame.SRCALPHA)
-            frame.blit(sprite_sheet, (0, 0),
-                     (col * self.sprite_width,
-                      0,
-                      self.sprite_width,
-                      self.sprite_height))
-            frames.append(frame)
-        return frames
+        stun_timer[stunned] -= dt[stunned]
+        expired = stunned & (stun_timer <= 0)
+        if expired.any():
+            stunned[expired] = False
+            speed[expired] = self.base_speed[ids][expired]
+        active = ~stunned
+        
+        offset = np.array(target, dtype=np.float64) - pos
+        dist = np.hypot(offset[:, 0], offset[:, 1])
+        
+        was_chasing = active & chasing
+        start = active & ~chasing & (dist < self.chase_distance)
+        chasing[start] = True
+        speed[start] = self.chase_speed[ids][start]
+        
+        steer = was_chasing & (dist > 0)
+        direction[steer] = offset[steer] / dist[steer, None]
+        if flow is not None and flow.goal is not None:
+            # Chasers follow the shared flow field around walls; close in, or off the field, they head straight for the player
+            steering = np.flatnonzero(steer)
+            targets, ok = flow.sample(pos[steering])
+            steering = steering[ok]
+            if steering.size:
+                heading = targets[ok] - pos[steering]
+                length = np.hypot(heading[:, 0], heading[:, 1])
+                moved = length > 0
+                direction[steering[moved]] = heading[moved] / length[moved, None]
+        
+        stop = was_chasing & (dist > self.chase_distance * 1.5)
+        chasing[stop] = False
+        speed[stop] = self.base_speed[ids][stop]
+        
+        animation_time[active] += dt[active]
+        advance = active & (animation_time >= self.animation_speed)
+        animation_time[advance] = 0
+        frame[advance] = (frame[advance] + 1) % self.frame_count[ids][advance]
+        
+        moving = np.flatnonzero(active & (speed != 0) & direction.any(axis=1))
+        if moving.size:
+            new_pos = pos[moving] + direction[moving] * (speed[moving] * dt[moving])[:, None]
+            half_w = self.sprite_width // 2
+            half_h = self.sprite_height // 2
+            np.clip(new_pos[:, 0], half_w, self.world_width - self.sprite_width + half_w, out=new_pos[:, 0])
+            np.clip(new_pos[:, 1], half_h, self.world_height - self.sprite_height + half_h, out=new_pos[:, 1])
+            
+            # Mobs that would end up inside a wall stay where they were
+            blocked = walls.collides_many(self.boxes(new_pos))
+            pos[moving[~blocked]] = new_pos[~blocked]
+        
+        expired = np.flatnonzero(expired)
+        if not isinstance(ids, slice):
+            # Fancy indexing gathered copies, so scatter them back
+            self.pos[ids] = pos
+            self.direction[ids] = direction
+            self.speed[ids] = speed
+            self.chasing[ids] = chasing
+            self.stunned[ids] = stunned
+            self.stun_timer[ids] = stun_timer
+            self.animation_time[ids] = animation_time
+            self.frame[ids] = frame
+            expired = ids[expired]
+        return expired
+    
+    def capture(self, state):
+        # Copies every live mob into state, reusing the arrays from an earlier capture of the same swarm
+        n = self.count
+        for name in self.fields:
+            live = getattr(self, name)[:n]
+            saved = state.get(name)
+            if saved is None or saved.shape != live.shape:
+                state[name] = live.copy()
+            else:
+                np.copyto(saved, live)
+        # Throttled mobs take their turns by tick number
+        state["ticks"] = self.ticks
+        return state
+    
+    def restore(self, state):
+        # Written back in place, so worker processes keep seeing the same shared arrays
+        n = self.count
+        for name in self.fields:
+            np.copyto(getattr(self, name)[:n], state[name])
+        self.ticks = state["ticks"]
+        self.grid_stale = True
+        stunned = self.stunned[:n]
+        self.retint(np.flatnonzero(stunned), Mob.stunned_color)
+        self.restore_tint(np.flatnonzero(~stunned))
+    
+    def retint(self, indices, color):
+        # Every mob in a state shares one prepared frame list, so a crowd is retinted by reference
+        frames = Mob.load_sprite_sheet(Mob.sheet_file, Mob.cols, Mob.rows, color)
+        mobs = self.mobs
+        for i in np.atleast_1d(indices).tolist():
+            mobs[i].frames = frames
+    
+    def restore_tint(self, indices):
+        self.retint(indices, Mob.normal_color)
+    
+    def close(self):
+        pass
     
     def update_speed(self, suspicion_modifier):
-        self.speed = self.base_speed * suspicion_modifier
-        self.chase_speed = self.base_chase_speed * suspicion_modifier
-        
-        if self.chasing and not self.stunned:
-            self.speed = self.chase_speed
-        elif not self.stunned:
-            self.speed = self.base_speed * suspicion_modifier
-    
-    def update(self, dt, player, walls):
-        if self.stunned:
-            self.stun_timer -= dt
-            if self.stun_timer <= 0:
-                self.stunned = False
-                self.speed = self.base_speed
-                for frame in self.frames:
-                    frame.fill(self.normal_color, special_flags=pygame.BLEND_MULT)
-        
-        if not self.stunned:
-            if not self.chasing:
-                dx = player.rect.centerx - self.rect.centerx
-                dy = player.rect.centery - self.rect.centery
-                dist = math.sqrt(dx**2 + dy**2)
-                
-                if dist < self.chase_distance:
-                    self.chasing = True
-                    self.speed = self.chase_speed
+        n = self.count
+        self.chase_speed[:n] = self.base_chase_speed[:n] * suspicion_modifier
+        self.speed[:n] = np.where(self.chasing[:n] & ~self.stunned[:n],
+                                  self.chase_speed[:n], self.base_speed[:n] * suspicion_modifier)
+    
+    def stun(self, indices, duration):
+        self.stunned[indices] = True
+        self.stun_timer[indices] = duration
+        self.speed[indices] = 0
+        self.retint(indices, Mob.stunned_color)
+    
+    def within(self, x, y, radius):
+        # Mobs whose centre is at most radius from (x, y), in index order
+        ids = self.spatial_index().candidates(x - radius, y - radius, x + radius + 1, y + radius + 1)
+        offset = self.pos[ids] - (x, y)
+        ids = ids[np.hypot(offset[:, 0], offset[:, 1]) <= radius]
+        ids.sort()
+        return ids
+    
+    def nearest(self, x, y, max_distance=math.inf):
+        # Index of the mob whose centre is closest to (x, y), or -1. Rings of cells are searched outwards
+        # until no unsearched cell can hold anything closer
+        grid = self.spatial_index()
+        col, row = grid.cell_of(x, y)
+        best = -1
+        best_distance = max_distance
+        for radius in range(max(grid.cols, grid.rows)):
+            if (radius - 1) * grid.cell_size > best_distance:
+                break
+            ids = grid.ring(col, row, radius)
+            if ids.size:
+                offset = self.pos[ids] - (x, y)
+                distance = np.hypot(offset[:, 0], offset[:, 1])
+                k = int(distance.argmin())
+                if distance[k] < best_distance or (distance[k] == best_distance and best < 0):
+                    best = int(ids[k])
+                    best_distance = float(distance[k])
+        return best
+    
+    def stun_within(self, x, y, radius, duration):
+        indices = self.within(x, y, radius)
+        if indices.size:
+            self.stun(indices, duration)
+        return indices.size
+    
+    def boxes_in(self, rect, alpha=1.0):
+        # Indices (in index order, which is draw order) and boxes of the mobs overlapping rect when drawn at alpha.
+        # Between ticks a mob is at most one tick's move from the position the grid was built from
+        margin_x = self.sprite_width
+        margin_y = self.sprite_height
+        if alpha < 1.0:
+            margin_x += self.grid.cell_size
+            margin_y += self.grid.cell_size
+        ids = self.spatial_index().candidates(rect.left - margin_x, rect.top - margin_y,
+                                              rect.right + margin_x, rect.bottom + margin_y)
+        ids = np.sort(ids)  # Candidates can be a view into the grid's own order
+        boxes = self.boxes(self.render_pos(alpha, ids))
+        hit = ((boxes[:, 0] < rect.right) & (boxes[:, 2] > rect.left) &
+               (boxes[:, 1] < rect.bottom) & (boxes[:, 3] > rect.top))
+        return ids[hit], boxes[hit]
+    
+    def collide_rect(self, rect, alpha=1.0):
+        return self.boxes_in(rect, alpha)[0]
+    
+    def screen_rects(self, camera, alpha=1.0):
+        boxes = self.boxes_in(camera.visible_rect, alpha)[1]
+        boxes[:, 0] += camera.camera.x
+        boxes[:, 1] += camera.camera.y
+        return [pygame.Rect(left, top, self.sprite_width, self.sprite_height)
+                for left, top in zip(boxes[:, 0].tolist(), boxes[:, 1].tolist())]
+    
+    def draw(self, surface, camera, view=None, alpha=1.0, scale=1):
+        visible, boxes = self.boxes_in(view or camera.visible_rect, alpha)
+        if visible.size:
+            offset_x, offset_y = camera.camera.topleft
+            lefts = (boxes[:, 0] + offset_x) // scale
+            tops = (boxes[:, 1] + offset_y) // scale
+            frames = self.frame
+            mobs = self.mobs
+            if scale == 1:
+                surface.blits([(mobs[i].frames[frames[i]], (left, top))
+                               for i, left, top in zip(visible.tolist(), lefts.tolist(), tops.tolist())], False)
             else:
-                dx = player.rect.centerx - self.rect.centerx
-                dy = player.rect.centery - self.rect.centery
-                dist = math.sqrt(dx**2 + dy**2)
-                
-                if dist > 0:
-                    dx /= dist
-                    dy /= dist
-                    self.direction = pygame.Vector2(dx, dy)
-                
-                if dist > self.chase_distance * 1.5:
-                    self.chasing = False
-                    self.speed = self.base_speed
+                # Mobs share a few frame lists, so each is shrunk once
+                scaled = scaled_images.frames
+                surface.blits([(scaled(mobs[i].frames, scale)[frames[i]], (left, top))
+                               for i, left, top in zip(visible.tolist(), lefts.tolist(), tops.tolist())], False)
+        return visible.size
+
+# State each partition worker inherits when the pool forks
+partition_worker = None
+
+def init_partition_worker(swarm, walls, flow):
+    global partition_worker
+    # SDL's signal handlers came across with the fork and would turn SIGTERM into a quit event nobody reads
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    partition_worker = (swarm, walls, flow)
+
+def advance_partition(task):
+    # Runs in a worker: advances the mobs inside one vertical strip of the world
+    swarm, walls, flow = partition_worker
+    left, right, count, target, flow_state = task
+    if flow_state is not None:
+        flow.goal, flow.origin, flow.next_cell = flow_state
+    # Split on where mobs started the tick: other workers are writing pos, and a mob one of them
+    # just moved across the strip edge would be stepped twice
+    x = swarm.prev_pos[:count, 0]
+    # The game process scheduled this tick: mobs it skipped have no time step
+    ids = np.flatnonzero((x >= left) & (x < right) & (swarm.tick_dt[:count] > 0))
+    if ids.size == 0:
+        return ids
+    return swarm.step(ids, swarm.tick_dt[ids], target, walls, flow if flow_state is not None else None)
+
+class SharedMobSwarm(MobSwarm):
+    # Mob arrays live in shared memory and the AI for each strip of the world runs in a forked worker;
+    # the game process only stuns, draws and checks the player against the results
+    def __init__(self, capacity=64, world_width=WORLD_WIDTH, world_height=WORLD_HEIGHT, workers=2):
+        self.workers = workers
+        self.blocks = []
+        self.pool = None
+        super().__init__(capacity, world_width, world_height)
+    
+    def new_array(self, shape, dtype):
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self.blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        return array
+    
+    def allocate(self, capacity):
+        # Workers map the old blocks, so they are restarted on the next update
+        self.close_pool()
+        old_blocks = self.blocks
+        self.blocks = []
+        super().allocate(capacity)
+        for block in old_blocks:
+            block.unlink()
+    
+    def update(self, dt, player, walls, flow=None, view=None):
+        n = self.count
+        if n == 0:
+            return False
         
-            old_pos = super().update(dt)
-            
-            wall_collisions = pygame.sprite.spritecollide(self, walls, False)
-            if wall_collisions:
-                self.pos = old_pos
-                self.rect.center = self.pos
-            
-            if self.rect.top > WORLD_HEIGHT + 15 or self.rect.left < -15 or self.rect.right > WORLD_WIDTH + 15:
-                self.rect.x = random.randrange(WORLD_WIDTH - self.sprite_width)
-                self.rect.y = random.randrange(-100, -50)
-                self.chasing = False
-                self.speed = self.base_speed
-    
-    def get_stunned(self, duration):
-        self.stunned = True
-        self.stun_timer = duration
-        self.speed = 0
-        for frame in self.frames:
-            frame.fill(self.stunned_color, special_flags=pygame.BLEND_MULT)
-
-def show_win_screen():
-    screen.fill(BLACK)
-    draw_text(screen, "YOU WIN!", 64, GREEN, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
-    draw_text(screen, "Congratulations! You solved the puzzle!", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-    draw_text(screen, "Press any key to exit", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3/4)
-    pygame.display.flip()
-    
-    waiting = True
-    while waiting:
-        clock.tick(FPS)
-        #for event in pygame.event.get():
-        #    if event.type == pygame.QUIT:
-        #        pygame.quit()
-        #        return False
-        #    if event.type == pygame.KEYUP:
-        #        return True
-
-def main():
-    if not show_start_screen():
-        return
-    
-    suspicion_system = SuspicionSystem()
-    wheel_cipher = WheelCipher()
-    camera = Camera(WORLD_WIDTH, WORLD_HEIGHT)
-    
-    running = True
-    while running:
-        all_sprites = pygame.sprite.Group()
-        walls = pygame.sprite.Group()
-        signs = pygame.sprite.Group()
-
-        # Create walls
-        wall_positions = [
-            (50, 1000, 1000, 100),
-            (2050, 1000, 1000, 100),
-            (950, 1000, 100, 2000),
-            (2050, 1000, 100, 2000),
-            (800, 700, 50, 200),
-            (1100, 600, 200, 50),
-            (1300, 900, 300, 50),
-            (200, 300, 200, 50),
-            (1500, 400, 50, 200),
-            (1800, 800, 200, 50),
-            (2200, 600, 300, 50)
-        ]
-
-        for x, y, w, h in wall_positions:
-            wall = Wall(x, y, w, h)
-            all_sprites.add(wall)
-            walls.add(wall)
-
-        # Place signs in the world
-        sign1 = Sign(700, 600, 
-                    "(key) G2",
-                    "They're watching you! Be careful!")
-        sign2 = Sign(1500, 800,
-                    "MJD",
-                    "They're getting faster! Use your stun wisely!")
-        all_sprites.add(sign1)
-        all_sprites.add(sign2)
-        signs.add(sign1)
-        signs.add(sign2)
-
-        # Add the code terminal
-        terminal = CodeTerminal(2000, 500)
-        all_sprites.add(terminal)
-
-        # Start player in center of world
-        player = Player(WORLD_WIDTH // 2, WORLD_HEIGHT // 2)
-        all_sprites.add(player)
-
-        default_music = MusicPlayer("2.Aria of the Soul(P4).mp3")
-        chase_music = MusicPlayer("Hollow Knight OST.mp3")
-        default_music.play()
-        default_music.set_volume(1.0)
-        
-        # Spread mobs throughout the world
-        mobs = pygame.sprite.Group()
-        for i in range(8):
-            mob = Mob(random.randint(0, WORLD_WIDTH), random.randint(0, WORLD_HEIGHT))
-            all_sprites.add(mob)
-            mobs.add(mob)
-
-
-
-        playing = True
-        dt = 0
-        chase_music_playing = False
+        self.schedule(dt, player.rect.center, view)
+        if self.pool is None:
+            # Forking hands the workers the walls and these arrays without pickling them
+            self.pool = multiprocessing.get_context("fork").Pool(
+                self.workers, initializer=init_partition_worker, initargs=(self, walls, flow))
         
-        while playing:
-            # Update camera position
-            camera.update(player)
-            
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    playing = False
-                    running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        playing = False
-                        running = False
-                    elif event.key == pygame.K_o and player.can_interact:
-                        if player.near_sign:
-                            sign_text = player.near_sign.get_text(suspicion_system.suspicion)
-                            if not show_message_screen(sign_text):
-                                playing = False
-                                running = False
-                        elif player.near_terminal:
-                            # Show code input screen
-                            continue_game, code_correct = show_code_input_screen()
-                            if not continue_game:
-                                playing = False
-                                running = False
-                            elif code_correct:
-                                # Player won!
-                                if show_win_screen():
-                                    playing = False
-                                    running = False
-                    elif event.key == pygame.K_i:
-                        wheel_cipher.toggle()
-                    elif wheel_cipher.visible and event.key == pygame.K_RETURN:
-                        wheel_cipher.toggle()
+        flow_state = None
+        if flow is not None and flow.goal is not None:
+            flow_state = (flow.goal, flow.origin, flow.next_cell)
+        edges = np.linspace(0, self.world_width, self.workers + 1).tolist()
+        edges[0] = -math.inf
+        edges[-1] = math.inf
+        tasks = [(edges[k], edges[k + 1], n, player.rect.center, flow_state) for k in range(self.workers)]
+        self.restore_tint(np.concatenate(self.pool.map(advance_partition, tasks)))
+        self.grid_stale = True
+        return self.any_chasing
+    
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+    
+    def close(self):
+        self.close_pool()
+        for block in self.blocks:
+            block.unlink()
+        self.blocks = []
+
+class Level:
+    # Everything static in a level. The JSON source is parsed once and compiled, along with its
+    # pathfinding grid, into a binary cache next to it; later loads whose source hash matches
+    # read that cache in one go instead
+    header = struct.Struct("<4sB20s14i")
+    nav_params = (25, Mob.sprite_width, Mob.sprite_height)  # Flow field cell size and the footprint it is for
+    
+    def __init__(self, width, height, walls, signs=(), terminals=(), spawn_zones=(), player_start=None):
+        self.width = width
+        self.height = height
+        self.walls = [tuple(wall) for wall in walls]
+        self.signs = [tuple(sign) for sign in signs]
+        self.terminals = [tuple(terminal) for terminal in terminals]
+        self.spawn_zones = [tuple(zone) for zone in spawn_zones]
+        self.player_start = tuple(player_start) if player_start else (width // 2, height // 2)
+        self.blocked = None
+        self.statics = {}
+    
+    @property
+    def mob_count(self):
+        return sum(zone[4] for zone in self.spawn_zones)
+    
+    @classmethod
+    def load(cls, path):
+        source = read_file(path)
+        digest = hashlib.sha1(source).digest()
+        cache_path = os.path.splitext(path)[0] + ".lvc"
+        try:
+            level = cls.from_compiled(read_file(cache_path), digest)
+        except OSError:
+            level = None
+        if level is not None:
+            return level
+        
+        level = cls.parse(json.loads(source))
+        try:
+            with open(cache_path + ".tmp", "wb") as f:
+                f.write(level.compile(digest))
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass  # A read-only install just compiles on every launch
+        return level
+    
+    @classmethod
+    def parse(cls, data):
+        return cls(
+            data["width"], data["height"], data["walls"],
+            [(sign["x"], sign["y"], sign["text"], sign.get("high_suspicion_text")) for sign in data.get("signs", [])],
+            [(terminal["x"], terminal["y"], terminal["code"]) for terminal in data.get("terminals", [])],
+            [(zone["x"], zone["y"], zone["width"], zone["height"], zone["count"]) for zone in data.get("spawn_zones", [])],
+            data.get("player_start"),
+        )
+    
+    def compile(self, digest):
+        # Header, then int32 tables for walls, signs, terminals and spawn zones, the bit-packed
+        # pathfinding grid and finally every string as one UTF-8 blob the tables point into
+        text = bytearray()
+        
+        def intern(value):
+            if value is None:
+                return (0, -1)
+            data = value.encode("utf-8")
+            text.extend(data)
+            return (len(text) - len(data), len(data))
+        
+        signs = [(x, y, *intern(normal), *intern(high)) for x, y, normal, high in self.signs]
+        terminals = [(x, y, *intern(code)) for x, y, code in self.terminals]
+        blocked = self.nav_grid(None)
+        rows, cols = blocked.shape
+        header = self.header.pack(
+            LEVEL_MAGIC, LEVEL_VERSION, digest, self.width, self.height, *self.player_start,
+            len(self.walls), len(signs), len(terminals), len(self.spawn_zones),
+            *self.nav_params, rows, cols, len(text))
+        
+        def table(rows, width):
+            return np.array(rows, dtype="<i4").reshape(-1, width).tobytes()
+        
+        return b"".join([header, table(self.walls, 4), table(signs, 6), table(terminals, 4),
+                         table(self.spawn_zones, 5), np.packbits(blocked).tobytes(), bytes(text)])
+    
+    @classmethod
+    def from_compiled(cls, data, digest):
+        # None when the cache is stale, from another version or cut short
+        if len(data) < cls.header.size:
+            return None
+        (magic, version, source_digest, width, height, start_x, start_y, wall_count, sign_count, terminal_count,
+         zone_count, cell_size, agent_width, agent_height, rows, cols, text_size) = cls.header.unpack_from(data)
+        if (magic, version, source_digest) != (LEVEL_MAGIC, LEVEL_VERSION, digest):
+            return None
+        if (cell_size, agent_width, agent_height) != cls.nav_params:
+            return None
+        
+        offset = cls.header.size
+        
+        def table(count, width):
+            nonlocal offset
+            size = count * width * 4
+            values = np.frombuffer(data, dtype="<i4", count=count * width, offset=offset).reshape(count, width)
+            offset += size
+            return values.tolist()
+        
+        try:
+            walls = table(wall_count, 4)
+            sign_rows = table(sign_count, 6)
+            terminal_rows = table(terminal_count, 4)
+            zones = table(zone_count, 5)
+            nav_size = (rows * cols + 7) // 8
+            blocked = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=nav_size, offset=offset),
+                                    count=rows * cols).reshape(rows, cols).astype(bool)
+            offset += nav_size
+        except ValueError:
+            return None
+        text = data[offset:offset + text_size]
+        if len(text) != text_size:
+            return None
+        
+        def string(start, size):
+            return None if size < 0 else text[start:start + size].decode("utf-8")
+        
+        signs = [(x, y, string(normal_start, normal_size), string(high_start, high_size))
+                 for x, y, normal_start, normal_size, high_start, high_size in sign_rows]
+        terminals = [(x, y, string(start, size)) for x, y, start, size in terminal_rows]
+        level = cls(width, height, walls, signs, terminals, zones, (start_x, start_y))
+        level.blocked = blocked
+        return level
+    
+    def build(self, map_file=None):
+        # Sprites and indices for the static part of the level, shared by every world played on it,
+        # so restarting only creates the player and the mobs
+        if map_file not in self.statics:
+            walls = pygame.sprite.Group(Wall(*wall) for wall in self.walls)
+            signs = pygame.sprite.Group(Sign(*sign) for sign in self.signs)
+            terminals = pygame.sprite.Group(CodeTerminal(*terminal) for terminal in self.terminals)
             
-            any_chasing = False
-            for mob in mobs:
-                mob.update(dt, player, walls)
-                if mob.chasing and not mob.stunned:
-                    any_chasing = True
+            # Static walls never move, so index them once for collision queries
+            wall_index = StaticCollisionGrid(walls)
+            tile_map = None
+            if map_file:
+                tile_map = TileMap.load(map_file)
+                wall_index = CollisionLayers(wall_index, tile_map)
             
+            # Scenery never moves, so it is indexed once for visibility queries
+            scenery = StaticCollisionGrid([*walls, *signs, *terminals], cell_size=256)
+            self.statics[map_file] = (walls, signs, terminals, wall_index, tile_map, scenery)
+        return self.statics[map_file]
+    
+    def nav_grid(self, map_file=None):
+        # The compiled grid only knows about the level's own walls; a tile map's solid tiles need a fresh one
+        if map_file is not None:
+            return None
+        if self.blocked is None:
+            cell_size, agent_width, agent_height = self.nav_params
+            wall_index = self.build()[3]
+            self.blocked = FlowField.rasterize(wall_index, self.width, self.height, agent_width, agent_height, cell_size)
+        return self.blocked
+
+class WorldSnapshot:
+    # What a world changes while it is played; its static level is never copied
+    def __init__(self):
+        self.player = {}
+        self.mobs = {}
+        self.flow = None
+        self.camera = pygame.Rect(0, 0, 0, 0)
+        self.suspicion = None
+        self.rng_state = None
+
+class World:
+    def __init__(self, level, map_file=MAP_FILE, mob_workers=MOB_WORKERS):
+        self.level = level
+        self.width = width = level.width
+        self.height = height = level.height
+        (self.walls, self.signs, self.terminals, self.wall_index,
+         self.tile_map, self.scenery) = level.build(map_file)
+
+        self.player = Player(*level.player_start)
+        self.player.bounds = pygame.Rect(0, 0, width, height)
+        self.actors = pygame.sprite.Group(self.player)
+        
+        # Scatter each spawn zone's mobs across it
+        mob_count = level.mob_count
+        if mob_workers and "fork" in multiprocessing.get_all_start_methods():
+            self.mobs = SharedMobSwarm(max(64, mob_count), width, height, mob_workers)
+        else:
+            self.mobs = MobSwarm(max(64, mob_count), width, height)
+        for x, y, w, h, count in level.spawn_zones:
+            for i in range(count):
+                self.mobs.spawn(rng.randint(x, x + w), rng.randint(y, y + h))
+
+        # Chasers share one path field over the static walls
+        self.flow = FlowField(self.wall_index, width, height, Mob.sprite_width, Mob.sprite_height,
+                              blocked=level.nav_grid(map_file))
+
+        self.camera = Camera(width, height)
+        self.renderer = WorldRenderer(self.scenery, self.actors, self.tile_map, self.mobs)
+    
+    def update(self, dt, suspicion_system, keys=None, player_frozen=False):
+        # One simulation tick; the positions it starts from are kept for interpolated drawing
+        self.snap()
+        
+        with profiler.section("pathfinding"):
+            # Rebuilt only when the player crosses into another cell, and only while someone is chasing
+            if self.mobs.any_chasing:
+                self.flow.update(*self.player.rect.center)
+        profiler.count("flow_builds", self.flow.builds)
+        
+        with profiler.section("mobs"):
+            any_chasing = self.mobs.update(dt, self.player, self.wall_index, self.flow, self.camera.visible_rect)
+        profiler.count("mobs_active", self.mobs.active_count)
+        profiler.count("mobs_throttled", self.mobs.throttled_count)
+        profiler.count("mobs_asleep", self.mobs.asleep_count)
+        
+        with profiler.section("suspicion"):
             suspicion_system.update(dt, any_chasing)
             suspicion_modifier = suspicion_system.get_suspicion_modifier()
-            for mob in mobs:
-                mob.update_speed(suspicion_modifier)
-            
-            if not wheel_cipher.visible:
-                player.update(dt, walls, signs, terminal, mobs, camera)
+            self.mobs.update_speed(suspicion_modifier)
+        
+        if not player_frozen:
+            with profiler.section("player"):
+                self.player.update(dt, self.wall_index, self.signs, self.terminals, self.mobs, self.camera, keys)
+        return any_chasing
+    
+    def snap(self):
+        self.player.prev_pos = self.player.pos.copy()
+        self.mobs.snap()
+    
+    def snapshot(self, snapshot=None):
+        # Passing an earlier snapshot of this world overwrites it, reusing its buffers
+        if snapshot is None:
+            snapshot = WorldSnapshot()
+        self.player.capture(snapshot.player)
+        self.mobs.capture(snapshot.mobs)
+        # A flow field's arrays are replaced on rebuild, never modified, so holding on to them is enough
+        flow = self.flow
+        snapshot.flow = (flow.goal, flow.origin, flow.next_cell)
+        snapshot.camera.update(self.camera.camera)
+        return snapshot
+    
+    def restore(self, snapshot):
+        # In place: the sprites, swarm arrays and static level stay as they are
+        self.player.restore(snapshot.player)
+        self.mobs.restore(snapshot.mobs)
+        self.flow.goal, self.flow.origin, self.flow.next_cell = snapshot.flow
+        self.camera.camera.update(snapshot.camera)
+    
+    def close(self):
+        self.mobs.close()
+    
+    def player_caught(self):
+        return self.mobs.collide_rect(self.player.rect).size > 0
+    
+    def draw(self, surface, area=None, alpha=1.0, scale=1):
+        self.renderer.draw(surface, self.camera, area, alpha, scale)
+    
+    def moving_rects(self, alpha=1.0):
+        # Screen rects of everything that can change between frames with a still camera
+        player_rect = self.camera.apply_rect(self.player.render_rect(alpha))
+        prompt_rect = pygame.Rect(0, 0, 320, 30)
+        prompt_rect.center = (player_rect.centerx, player_rect.top - 20)
+        return [player_rect.union(prompt_rect)] + self.mobs.screen_rects(self.camera, alpha)
+
+class WinScene(Scene):
+    static = True
+    
+    def handle_event(self, event):
+        # KEYDOWN, so releasing the ENTER that submitted the code doesn't skip the screen
+        if event.type == pygame.KEYDOWN:
+            self.stack.clear()
+    
+    def draw(self, surface):
+        surface.fill(BLACK)
+        draw_text(surface, "YOU WIN!", 64, GREEN, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
+        draw_text(surface, "Congratulations! You solved the puzzle!", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        draw_text(surface, "Press any key to exit", 36, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3/4)
+
+def hud_values(player, suspicion_system, wheel_cipher):
+    # What each HUD widget currently shows, quantized to what is visible on screen
+    if player.stun_cooldown > 0:
+        stun = int(200 * (1 - player.stun_cooldown / player.stun_cooldown_time))
+    else:
+        stun = None if wheel_cipher.visible else "prompt"
+    return {
+        "stun": stun,
+        "meter": int(200 * suspicion_system.suspicion / suspicion_system.max_suspicion),
+        "hint": wheel_cipher.visible,
+    }
+
+def world_digest(world, suspicion_system):
+    digest = hashlib.sha1()
+    digest.update(struct.pack("<dd", *world.player.pos))
+    digest.update(world.mobs.pos[:world.mobs.count].tobytes())
+    digest.update(world.mobs.chasing[:world.mobs.count].tobytes())
+    digest.update(world.mobs.stunned[:world.mobs.count].tobytes())
+    digest.update(struct.pack("<d", suspicion_system.suspicion))
+    return digest.digest()
+
+def load_assets():
+    # The start screen's preload, run to completion without a title screen
+    preloader = AssetPreloader(assets)
+    preload_game_assets(preloader)
+    preloader.shutdown()
+    warm_sprite_sheets()
+
+class GameSession:
+    # What outlives a single game: the level and its world, suspicion, the cipher wheel, music, the renderer and the run summary
+    def __init__(self, input_source=None, seed=None, level=None):
+        self.input_source = input_source
+        self.seed = seed
+        self.started = False
+        self.suspicion_system = SuspicionSystem()
+        self.wheel_cipher = WheelCipher()
+        self.hud = HudLayer()
+        self.render_target = RenderTarget(screen.get_size(), RENDER_SCALE) if RENDER_SCALE > 1 else None
+        self.frame_renderer = DirtyRectRenderer(DIRTY_RECTS, self.render_target and self.render_target.align)
+        self.music = None
+        self.level = level
+        self.world = None
+        self.start_state = None
+        self.saved_state = None
+        self.summary = {"games": 0, "frames": 0, "outcome": None, "digest": None}
+    
+    def new_world(self):
+        global game_input
+        if not self.started:
+            # Recording and replay start here, after the title screen, whose timing depends on asset loading
+            self.started = True
+            if self.input_source is not None:
+                game_input = self.input_source
+            if self.seed is not None:
+                rng.seed(self.seed)
+            # Built after the title screen, whose preloader decodes the tracks off the main thread
+            self.music = AudioManager(DEFAULT_MUSIC, CHASE_MUSIC)
+        
+        if self.world is None:
+            if self.level is None:
+                self.level = Level.load(LEVEL_FILE)
+            self.world = World(self.level, MAP_FILE, MOB_WORKERS)
+            self.start_state = self.world.snapshot()
+        else:
+            # Playing again puts the same world back how it started instead of building another
+            self.world.restore(self.start_state)
+        self.summary["games"] += 1
+        return self.world
+    
+    def quicksave(self):
+        suspicion = self.suspicion_system
+        self.saved_state = self.world.snapshot(self.saved_state)
+        self.saved_state.suspicion = (suspicion.suspicion, suspicion.effective_suspicion)
+        self.saved_state.rng_state = rng.getstate()
+    
+    def quickload(self):
+        if self.saved_state is None:
+            return False
+        suspicion = self.suspicion_system
+        self.world.restore(self.saved_state)
+        suspicion.suspicion, suspicion.effective_suspicion = self.saved_state.suspicion
+        rng.setstate(self.saved_state.rng_state)
+        return True
+    
+    def close(self):
+        if self.world is not None:
+            self.summary["digest"] = world_digest(self.world, self.suspicion_system).hex()
+            self.world.close()
+
+class PlayScene(Scene):
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.suspicion_system = session.suspicion_system
+        self.wheel_cipher = session.wheel_cipher
+        self.frame_renderer = session.frame_renderer
+        self.hud = session.hud
+        self.render_target = session.render_target
+        self.scheduler = FixedTimestep()
+    
+    def enter(self):
+        self.world = self.session.new_world()
+        self.player = self.world.player
+        self.camera = self.world.camera
+        self.session.music.start()
+        self.frame_renderer.invalidate()
+    
+    def exit(self):
+        self.session.music.stop()
+    
+    def resume(self):
+        # Back from a sign or the terminal: redraw everything, and don't simulate the time spent there
+        self.frame_renderer.invalidate()
+        self.scheduler.reset()
+        self.world.snap()
+    
+    def invalidate(self):
+        self.frame_renderer.invalidate()
+    
+    def handle_event(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        
+        player = self.player
+        if event.key == pygame.K_ESCAPE:
+            self.session.summary["outcome"] = "quit"
+            self.stack.quit()
+        elif event.key == pygame.K_o and player.can_interact:
+            if player.near_sign:
+                sign_text = player.near_sign.get_text(self.suspicion_system.suspicion)
+                self.stack.push(MessageScene(sign_text))
+            elif player.near_terminal:
+                self.stack.push(CodeInputScene(self.session, player.near_terminal.code))
+        elif event.key == pygame.K_F3:
+            profiler.toggle()
+        elif event.key == pygame.K_F4:
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            profiler.export(f"profile-{stamp}.json")
+            profiler.export(f"profile-{stamp}.csv")
+        elif event.key == pygame.K_F5:
+            self.session.quicksave()
+        elif event.key == pygame.K_F9:
+            if self.session.quickload():
+                self.frame_renderer.invalidate()
+                self.scheduler.reset()
+        elif event.key == pygame.K_i:
+            self.wheel_cipher.toggle()
+        elif self.wheel_cipher.visible and event.key == pygame.K_RETURN:
+            self.wheel_cipher.toggle()
+    
+    def update(self, dt):
+        world = self.world
+        scheduler = self.scheduler
+        
+        # Held keys are read once a frame and shared by every tick run in it
+        keys = game_input.pressed()
+        any_chasing = world.mobs.any_chasing
+        steps = scheduler.advance(dt)
+        for _ in range(steps):
+            any_chasing = world.update(scheduler.step, self.suspicion_system, keys, player_frozen=self.wheel_cipher.visible)
+            if world.player_caught():
+                self.stack.replace(GameOverScene(self.session))
+                break
+        if self.wheel_cipher.visible:
+            self.wheel_cipher.update(keys)
+        
+        # Update camera position
+        self.camera.update(self.player, scheduler.alpha)
+        
+        with profiler.section("music"):
+            self.session.music.update(dt, any_chasing)
+        profiler.count("music_switches", self.session.music.switches)
+        
+        self.session.summary["frames"] += 1
+        profiler.count("sim_steps", steps)
+        # Total simulated time thrown away after stalls, in seconds
+        profiler.count("sim_dropped_s", scheduler.dropped)
+    
+    def draw_hud(self, surface):
+        player = self.player
+        wheel_cipher = self.wheel_cipher
+        
+        # Draw suspicion effects (screen space)
+        self.suspicion_system.draw_effects(surface)
+        
+        # Meter, stun bar and hints come pre-drawn from the HUD layer; the meter sits under the wheel's
+        # dim overlay, the stun bar and hints stay readable on top of it
+        self.hud.update(hud_values(player, self.suspicion_system, wheel_cipher))
+        self.hud.draw(surface, ("meter",))
+        
+        # Draw wheel cipher (screen space)
+        wheel_cipher.draw(surface, self.suspicion_system.suspicion)
+        
+        # Draw UI elements (screen space)
+        if player.can_interact:
+            # Convert world position to screen position for interaction prompt
+            player_rect = self.camera.apply_rect(player.render_rect(self.scheduler.alpha))
+            screen_pos = player_rect.centerx, player_rect.top - 20
+            if player.near_terminal:
+                draw_text(surface, "Press O to access terminal", 24, WHITE, *screen_pos)
             else:
-                wheel_cipher.update()
-            
-            if any_chasing:
-                if not chase_music_playing:
-                    default_music.stop()
-                    chase_music.play()
-                    chase_music.set_volume(1.0)
-                    chase_music_playing = True
+                draw_text(surface, "Press O to read", 24, WHITE, *screen_pos)
+        
+        self.hud.draw(surface, ("stun", "hint"))
+    
+    def draw_frame(self, surface, area):
+        target = self.render_target
+        
+        # Draw on-screen sprites with camera offset
+        with profiler.section("world_render"):
+            if target is None:
+                surface.fill(BLACK)
+                self.world.draw(surface, area, self.scheduler.alpha)
             else:
-                if chase_music_playing:
-                    chase_music.stop()
-                    default_music.play()
-                    chase_music_playing = False
-            
-            collisions = pygame.sprite.spritecollide(player, mobs, False)
-            if collisions:
-                playing = False
-            
-            # Render
-            screen.fill(BLACK)
-            
-            # Draw all sprites with camera offset
-            for entity in all_sprites:
-                screen.blit(entity.image, camera.apply(entity))
-            
-            # Draw suspicion effects (screen space)
-            suspicion_system.draw_effects(screen)
-            
-            # Draw wheel cipher (screen space)
-            wheel_cipher.draw(screen, suspicion_system.suspicion)
-            
-            # Draw UI elements (screen space)
-            if player.can_interact:
-                # Convert world position to screen position for interaction prompt
-                screen_pos = camera.apply_rect(player.rect).centerx, camera.apply_rect(player.rect).top - 20
-                if player.near_terminal:
-                    draw_text(screen, "Press O to access terminal", 24, WHITE, *screen_pos)
+                if area is not None:
+                    # The dirty rect renderer hands over rects already aligned to target pixels
+                    target.surface.fill(BLACK, target.covering(area))
                 else:
-                    draw_text(screen, "Press O to read", 24, WHITE, *screen_pos)
-            
-            if player.stun_cooldown > 0:
-                cooldown_width = 200 * (1 - player.stun_cooldown / player.stun_cooldown_time)
-                pygame.draw.rect(screen, RED, (10, 10, cooldown_width, 20))
-                pygame.draw.rect(screen, WHITE, (10, 10, 200, 20), 2)
-                draw_text(screen, "Stun Cooldown", 20, WHITE, 110, 20)
-            elif not wheel_cipher.visible:
-                draw_text(screen, "Press P to stun nearby enemies", 24, WHITE, SCREEN_WIDTH // 2, 30)
-            
-            if wheel_cipher.visible:
-                draw_text(screen, "Press I to close cipher wheel", 24, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT - 30)
-            else:
-                draw_text(screen, "Press I to open cipher wheel", 24, WHITE, SCREEN_WIDTH // 2, SCREEN_HEIGHT - 30)
-            
-            pygame.display.flip()
-            dt = clock.tick(FPS) / 1000
+                    target.surface.fill(BLACK)
+                self.world.draw(target.surface, area, self.scheduler.alpha, target.scale)
+        
+        if target is not None:
+            with profiler.section("upscale"):
+                target.present(surface, area)
+        
+        # The HUD is drawn at the window's own resolution either way
+        with profiler.section("hud"):
+            self.draw_hud(surface)
         
-        default_music.stop()
-        if chase_music_playing:
-            chase_music.stop()
+        profiler.draw(surface)
+    
+    def draw(self, surface):
+        self.draw_frame(surface, None)
+    
+    def render(self, surface):
+        world = self.world
+        suspicion_system = self.suspicion_system
+        wheel_cipher = self.wheel_cipher
         
-        if running and not show_game_over_screen():
-            running = False
+        if self.frame_renderer.enabled:
+            moving_rects = world.moving_rects(self.scheduler.alpha)
+            self.hud.update(hud_values(self.player, suspicion_system, wheel_cipher))
+            hud = self.hud.state()
+            if wheel_cipher.visible:
+                hud["wheel"] = ((wheel_cipher.outer_angle, suspicion_system.suspicion > 80), wheel_cipher.rect)
+        else:
+            moving_rects, hud = [], {}
+        border_level = overlays.quantize((suspicion_system.suspicion - suspicion_system.high_suspicion_threshold) /
+                                         (suspicion_system.max_suspicion - suspicion_system.high_suspicion_threshold))
+        if profiler.overlay_visible:
+            hud["profiler"] = (profiler.frame_index, profiler.panel_rect())
+        self.frame_renderer.present(surface, self.draw_frame, self.camera.camera.topleft, moving_rects, hud,
+                                    (wheel_cipher.visible, border_level, profiler.overlay_visible))
+        profiler.count("sprites_drawn", world.renderer.drawn)
+        profiler.count("sprites_culled", world.renderer.culled)
 
+def main(input_source=None, seed=None, skip_start_screen=False):
+    session = GameSession(input_source, seed)
+    stack = SceneStack(screen)
+    if skip_start_screen:
+        load_assets()
+        stack.push(PlayScene(session))
+    else:
+        stack.push(TitleScene(session))
+    
+    try:
+        stack.run()
+    except ReplayFinished:
+        session.summary["outcome"] = "replay ended"
+    
+    session.close()
     pygame.quit()
+    if not session.started:
+        return None
+    summary = session.summary
+    if summary["outcome"] is None and stack.quit_requested:
+        summary["outcome"] = "quit"
+    return summary
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Lone Voyager")
+    parser.add_argument("--record", metavar="PATH", help="record the seed and every frame of input to PATH")
+    parser.add_argument("--seed", type=int, help="seed for mob placement and animation")
+    args = parser.parse_args()
+    
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 63)
+    recorder = InputRecorder(args.record, seed) if args.record else None
+    summary = None
+    try:
+        summary = main(recorder, seed)
+    finally:
+        if recorder:
+            recorder.close(bytes.fromhex(summary["digest"]) if summary and summary["digest"] else None)
+    if recorder and summary:
+        print(f"Recorded {summary['frames']} frames to {args.record}")
\ No newline at end of file
@@ -0,0 +1,172 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from headless import environment, game, summarize
+
+import numpy as np
+import pygame
+
+class ScriptedInput:
+    # Stands in for the keyboard and clock like a replay does: walks the player in a square, fires the stun
+    # now and then, opens the cipher wheel for a while, plays again after a game over, and quits after
+    # the given number of gameplay frames. Frames are counted in pressed(), which only PlayScene calls
+    directions = [pygame.K_d, pygame.K_s, pygame.K_a, pygame.K_w]
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame = 0
+
+    def events(self):
+        if self.frame >= self.frames:
+            return [pygame.event.Event(pygame.QUIT)]
+        if self.frame % 600 in (450, 540):
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_i, mod=0, unicode="i")]
+        return []
+
+    def wait(self):
+        # Only the game over screen waits; any key plays again
+        return [pygame.event.Event(pygame.KEYUP, key=pygame.K_RETURN, mod=0)]
+
+    def pressed(self):
+        held = {self.directions[(self.frame // 90) % len(self.directions)]}
+        if self.frame % 300 == 299:
+            held.add(pygame.K_p)
+        self.frame += 1
+        return game.HeldKeys(held)
+
+    def tick(self, fps):
+        # Runs flat out with a fixed frame time, so every scenario simulates the same thing
+        return 1000 / fps
+
+def make_walls(count, width, height, seed):
+    rng = random.Random(seed)
+    spawn = pygame.Rect(0, 0, 400, 400)
+    spawn.center = (width // 2, height // 2)
+
+    walls = []
+    while len(walls) < count:
+        w, h = rng.choice([(50, 200), (200, 50), (300, 50), (50, 300), (100, 100)])
+        x = rng.randrange(0, (width - w) // 50) * 50
+        y = rng.randrange(0, (height - h) // 50) * 50
+        if not spawn.colliderect((x, y, w, h)):
+            walls.append((x, y, w, h))
+    return walls
+
+def make_spawn_zones(count, width, height):
+    # Four zones around the same 400x400 clearing the walls leave, so no mob starts on top of the player
+    spawn = pygame.Rect(0, 0, 400, 400)
+    spawn.center = (width // 2, height // 2)
+    zones = [(0, 0, width, spawn.top), (0, spawn.bottom, width, height - spawn.bottom),
+             (0, spawn.top, spawn.left, spawn.height), (spawn.right, spawn.top, width - spawn.right, spawn.height)]
+    total = sum(w * h for _, _, w, h in zones)
+    counts = [count * w * h // total for _, _, w, h in zones]
+    counts[0] += count - sum(counts)
+    return [(x, y, w, h, n) for (x, y, w, h), n in zip(zones, counts)]
+
+def mean_count(samples, name):
+    return round(float(np.mean([sample.get(name, 0) for sample in samples])), 1)
+
+def run_scenario(mob_count, wall_count, world_size, frames, warmup, seed, workers=0, render_scale=1,
+                 lod=True, dirty_rects=False):
+    # The shipped level's signs and terminal on a generated wall layout
+    base = game.Level.load(game.LEVEL_FILE)
+    level = game.Level(world_size, world_size, make_walls(wall_count, world_size, world_size, seed),
+                       base.signs, base.terminals, make_spawn_zones(mob_count, world_size, world_size))
+
+    # The game reads these when a session and its world are built
+    game.MOB_WORKERS = workers
+    game.MOB_LOD = lod
+    game.RENDER_SCALE = render_scale
+    game.DIRTY_RECTS = dirty_rects
+
+    profiler = game.profiler
+    profiler.enabled = True
+    profiler.pinned = True
+    profiler.samples.clear()
+
+    # The real scene loop: fixed timestep, HUD layer, cipher wheel and dirty rect renderer included
+    session = game.GameSession(ScriptedInput(warmup + frames), seed, level)
+    stack = game.SceneStack(game.screen)
+    stack.push(game.PlayScene(session))
+    stack.run()
+    session.close()
+
+    # Gameplay frames only; the game over screen, if the player was caught, is not part of the numbers
+    samples = [sample for sample in profiler.samples if "world_render_ms" in sample][warmup:]
+    update_times = np.array([sample["update_ms"] for sample in samples])
+    render_times = np.array([sample["render_ms"] for sample in samples])
+    frame_times = update_times + render_times
+
+    return {
+        "mobs": mob_count,
+        "walls": wall_count,
+        "world_size": world_size,
+        "workers": workers,
+        "render_scale": render_scale,
+        "lod": lod,
+        "dirty_rects": dirty_rects,
+        "games": session.summary["games"],
+        "update_ms": summarize(update_times),
+        "render_ms": summarize(render_times),
+        "frame_ms": summarize(frame_times),
+        "sprites_drawn": mean_count(samples, "sprites_drawn"),
+        "sprites_culled": mean_count(samples, "sprites_culled"),
+        "mobs_active": mean_count(samples, "mobs_active"),
+        "mobs_throttled": mean_count(samples, "mobs_throttled"),
+        "mobs_asleep": mean_count(samples, "mobs_asleep"),
+    }
+
+def int_list(text):
+    return [int(value) for value in text.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark for Lone Voyager")
+    parser.add_argument("--mobs", type=int_list, default=[8, 100, 1000], help="comma-separated mob counts")
+    parser.add_argument("--walls", type=int_list, default=[11, 200], help="comma-separated wall counts")
+    parser.add_argument("--world-sizes", type=int_list, default=[3000, 6000], help="comma-separated world edge lengths")
+    parser.add_argument("--frames", type=int, default=300, help="measured frames per scenario")
+    parser.add_argument("--warmup", type=int, default=30, help="unmeasured frames before each scenario")
+    parser.add_argument("--seed", type=int, default=323)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for mob AI (0 runs it in-process)")
+    parser.add_argument("--render-scale", type=int, default=1, help="draw the world at 1/N resolution and scale it up")
+    parser.add_argument("--no-lod", dest="lod", action="store_false",
+                        help="step every mob every frame instead of sleeping and throttling distant ones")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="redraw and present only the changed parts of the screen while the camera is still")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    game.load_assets()
+
+    scenarios = []
+    for world_size in args.world_sizes:
+        for wall_count in args.walls:
+            for mob_count in args.mobs:
+                result = run_scenario(mob_count, wall_count, world_size, args.frames, args.warmup, args.seed,
+                                      args.workers, args.render_scale, args.lod, args.dirty_rects)
+                scenarios.append(result)
+                print(f"world {world_size} walls {wall_count} mobs {mob_count}: "
+                      f"frame mean {result['frame_ms']['mean']:.2f} ms, p99 {result['frame_ms']['p99']:.2f} ms",
+                      file=sys.stderr)
+
+    report = {
+        **environment(),
+        "frames": args.frames,
+        "seed": args.seed,
+        "assets": game.assets.stats(),
+        "scenarios": scenarios,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import importlib
+import os
+import platform
+import sys
+
+# Headless: no window, no sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+# Keep pygame's import banner out of the JSON reports on stdout
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+# The game loads its assets relative to its own folder
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(GAME_DIR)
+sys.path.insert(0, GAME_DIR)
+
+import numpy as np
+import pygame
+
+game = importlib.import_module("323Game")
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        "mean": round(float(samples.mean()), 4),
+        "p95": round(float(np.percentile(samples, 95)), 4),
+        "p99": round(float(np.percentile(samples, 99)), 4),
+        "max": round(float(samples.max()), 4),
+    }
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
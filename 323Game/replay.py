@@ -0,0 +1,58 @@
+import argparse
+import json
+import sys
+import time
+
+from headless import environment, game, summarize
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Lone Voyager session headlessly and time it")
+    parser.add_argument("recording", help="file written by 323Game.py --record")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    replay = game.InputReplay(args.recording)
+    game.profiler.enabled = True
+    game.profiler.pinned = True
+
+    start = time.perf_counter()
+    summary = game.main(input_source=replay, seed=replay.seed, skip_start_screen=True)
+    elapsed = time.perf_counter() - start
+
+    samples = list(game.profiler.samples)
+    sections = {}
+    for sample in samples:
+        for key, value in sample.items():
+            if key.endswith("_ms"):
+                sections.setdefault(key[:-3], []).append(value)
+
+    expected = replay.digest.hex() if replay.digest else None
+    report = {
+        **environment(),
+        "recording": args.recording,
+        "seed": replay.seed,
+        "frames": summary["frames"],
+        "games": summary["games"],
+        "outcome": summary["outcome"],
+        "wall_seconds": round(elapsed, 3),
+        "fps": round(summary["frames"] / elapsed, 1) if elapsed else None,
+        "sections_ms": {name: summarize(values) for name, values in sections.items()},
+        "assets": game.assets.stats(),
+        "digest": summary["digest"],
+        "expected_digest": expected,
+        "identical": None if expected is None else summary["digest"] == expected,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if report["identical"] is False:
+        print("replay diverged from the recorded session", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()